@@ -0,0 +1,369 @@
+'''
+Character alignment between a text and a modified version of it.
+
+An `OffsetMap` tells, for every offset in the original text, the
+corresponding offset in the modified one; `align` computes one for any two
+texts. Text that only lost characters (or only gained some) is matched
+character by character. Otherwise the lines are matched first, then the
+words of the lines that differ, then the characters of the words that
+differ. At each level, the units found once in both texts anchor the
+match, and the stretches between them are matched in turn (as in
+"patience diff"), so the work stays close to linear, and repeated words
+are not matched across the text; `difflib` is only left the stretches
+without such anchors.
+'''
+
+from array import array
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from itertools import accumulate, chain
+from re import compile as re_compile
+
+
+# Units matched at each level: lines, then words (with the whitespace that
+# follows them), then characters. Units that only differ in case or in
+# their trailing whitespace are matched with each other
+_LEVELS = (
+    re_compile(r'[^\n]*\n|[^\n]+'),
+    re_compile(r'\S+\s*|\s+'),
+    None,
+)
+# Most unit comparisons `difflib` may make (the sum of the products of the
+# lengths of the stretches it is given) in one alignment. Lines or words it
+# cannot afford to match are matched by their words or characters instead;
+# characters it cannot afford raise `AlignmentError`
+MAX_MATCH_WORK = 10 ** 7
+
+
+class AlignmentError(ValueError):
+    """The texts are too different to be aligned within `MAX_MATCH_WORK`."""
+
+
+class OffsetMap(object):
+    """Maps offsets in an original text to offsets in a modified text.
+
+    `starts[i]` and `ends[i]` are the modified offsets of original offset
+    `i` when it is the start and the end of a span, respectively. They only
+    differ where text was inserted at `i`, which then belongs to neither
+    the span that starts there nor the one that ends there.
+    """
+
+    __slots__ = ('starts', 'ends', 'is_identity')
+
+    def __init__(self, starts, ends=None, is_identity=False):
+        self.starts = starts
+        self.ends = starts if ends is None else ends
+        self.is_identity = is_identity
+
+    def __len__(self):
+        # The number of offsets, i.e. one more than the original text length
+        return len(self.starts)
+
+    def map_span(self, start, end):
+        new_start = self.starts[start]
+        return new_start, max(new_start, self.ends[end])
+
+    def compose(self, other):
+        """Return the map from the original text of `self` to the modified
+        text of `other`, which modifies the modified text of `self`."""
+        if self.is_identity:
+            return other
+        if other.is_identity:
+            return self
+        starts = array('q', map(other.starts.__getitem__, self.starts))
+        if self.ends is self.starts and other.ends is other.starts:
+            return OffsetMap(starts)
+        return OffsetMap(
+            starts, array('q', map(other.ends.__getitem__, self.ends)))
+
+    @classmethod
+    def identity(cls, length):
+        return cls(array('q', range(length + 1)), is_identity=True)
+
+
+# Runs of this many units are tried in turn as anchors, when no single
+# unit is found once in both stretches
+_ANCHOR_SIZES = (1, 2, 4, 8)
+
+
+def _gram(keys, u, size):
+    if size == 1:
+        return keys[u]
+    gram = keys[u:u + size]
+    return gram if isinstance(gram, str) else tuple(gram)
+
+
+def _unique_anchors(keys, a0, a1, new_keys, b0, b1, isjunk, size):
+    # The pairs `(u, v)` of the runs of `size` keys found once in
+    # `keys[a0:a1]` and once in `new_keys[b0:b1]`, as many of them as are
+    # in the same order in both, and do not overlap
+    where = {}
+    for u in range(a0, a1 - size + 1):
+        key = _gram(keys, u, size)
+        where[key] = None if key in where else u
+    new_where = {}
+    for v in range(b0, b1 - size + 1):
+        key = _gram(new_keys, v, size)
+        if where.get(key) is not None:
+            new_where[key] = None if key in new_where else v
+    pairs = sorted(
+        (where[key], v) for key, v in new_where.items()
+        if v is not None and not (isjunk and isjunk(key)))
+    # The longest increasing run of `v`, by patience sorting
+    tails = []
+    tail_ixs = []
+    prev_ixs = []
+    for ix, (_, v) in enumerate(pairs):
+        k = bisect_left(tails, v)
+        prev_ixs.append(tail_ixs[k - 1] if k else None)
+        if k == len(tails):
+            tails.append(v)
+            tail_ixs.append(ix)
+        else:
+            tails[k] = v
+            tail_ixs[k] = ix
+    run = []
+    ix = tail_ixs[-1] if tail_ixs else None
+    while ix is not None:
+        run.append(pairs[ix])
+        ix = prev_ixs[ix]
+    anchors = []
+    u_end = v_end = -1
+    for u, v in reversed(run):
+        if u >= u_end and v >= v_end:
+            anchors.append((u, v))
+            u_end, v_end = u + size, v + size
+    return anchors
+
+
+def _matches(keys, new_keys, isjunk, budget, strict):
+    # The sorted pairs `(u, v)` of equal `keys[u]` and `new_keys[v]` that
+    # are matched with each other. `budget` is a one-item list of the
+    # `difflib` work left; past it, stretches are left unmatched, or with
+    # `strict`, `AlignmentError` is raised
+    matches = []
+    stack = [(0, len(keys), 0, len(new_keys))]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        while a0 < a1 and b0 < b1 and keys[a0] == new_keys[b0]:
+            matches.append((a0, b0))
+            a0 += 1
+            b0 += 1
+        while a0 < a1 and b0 < b1 and keys[a1 - 1] == new_keys[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+            matches.append((a1, b1))
+        if a0 == a1 or b0 == b1:
+            continue
+        for size in _ANCHOR_SIZES:
+            anchors = _unique_anchors(
+                keys, a0, a1, new_keys, b0, b1, isjunk, size)
+            if anchors:
+                break
+        if anchors:
+            for u, v in anchors:
+                matches.extend((u + k, v + k) for k in range(size))
+                stack.append((a0, u, b0, v))
+                a0, b0 = u + size, v + size
+            stack.append((a0, a1, b0, b1))
+            continue
+        if set(keys[a0:a1]).isdisjoint(new_keys[b0:b1]):
+            # Nothing to match
+            continue
+        work = (a1 - a0) * (b1 - b0)
+        if work > budget[0]:
+            if strict:
+                raise AlignmentError(
+                    'Cannot align %d characters with %d' % (a1 - a0, b1 - b0))
+            continue
+        budget[0] -= work
+        matcher = SequenceMatcher(
+            isjunk, keys[a0:a1], new_keys[b0:b1], autojunk=False)
+        for u, v, size in matcher.get_matching_blocks():
+            matches.extend(
+                (a0 + u + k, b0 + v + k) for k in range(size))
+    matches.sort()
+    return matches
+
+
+def _add_op(ops, tag, i1, i2, j1, j2):
+    # Append an edit to `ops`, joining it to the last if both are equal
+    if tag == 'equal' and ops:
+        last = ops[-1]
+        if last[0] == 'equal' and last[2] == i1 and last[4] == j1:
+            ops[-1] = ('equal', last[1], i2, last[3], j2)
+            return
+    ops.append((tag, i1, i2, j1, j2))
+
+
+def _opcodes(text, new_text, i, i_end, j, j_end, level, ops, budget):
+    # Append to `ops` the `(tag, i1, i2, j1, j2)` character edits turning
+    # `text[i:i_end]` into `new_text[j:j_end]`, as `difflib` has them
+    if _subsequence_opcodes(text, new_text, i, i_end, j, j_end, ops):
+        return
+    pattern = _LEVELS[level]
+    if pattern is None:
+        units = keys = text[i:i_end]
+        new_units = new_keys = new_text[j:j_end]
+    else:
+        units = pattern.findall(text, i, i_end)
+        new_units = pattern.findall(new_text, j, j_end)
+        if len(units) <= 1 and len(new_units) <= 1:
+            _opcodes(text, new_text, i, i_end, j, j_end, level + 1, ops,
+                     budget)
+            return
+        keys = [unit.rstrip().lower() for unit in units]
+        new_keys = [unit.rstrip().lower() for unit in new_units]
+    # Character offsets of the units
+    offsets = list(accumulate(chain((i,), map(len, units))))
+    new_offsets = list(accumulate(chain((j,), map(len, new_units))))
+    # Characters are not matched starting from whitespace, which is too
+    # common to tell where they belong
+    matches = _matches(keys, new_keys, str.isspace if pattern is None else None,
+                       budget, pattern is None)
+
+    def pair(u, v):
+        i1, i2 = offsets[u], offsets[u + 1]
+        j1, j2 = new_offsets[v], new_offsets[v + 1]
+        if units[u] == new_units[v]:
+            _add_op(ops, 'equal', i1, i2, j1, j2)
+        elif (i2 - i1 == j2 - j1
+                and units[u].lower() == new_units[v].lower()):
+            # Only changed in case
+            ops.append(('replace', i1, i2, j1, j2))
+        else:
+            _opcodes(text, new_text, i1, i2, j1, j2, level + 1, ops, budget)
+
+    prev_u = prev_v = 0
+    for u, v in chain(matches, [(len(units), len(new_units))]):
+        i1, i2 = offsets[prev_u], offsets[u]
+        j1, j2 = new_offsets[prev_v], new_offsets[v]
+        if i1 == i2 and j1 == j2:
+            pass
+        elif i1 == i2:
+            ops.append(('insert', i1, i2, j1, j2))
+        elif j1 == j2:
+            ops.append(('delete', i1, i2, j1, j2))
+        elif pattern is None:
+            ops.append(('replace', i1, i2, j1, j2))
+        elif u - prev_u == v - prev_v:
+            # Each line (or word) is matched with its counterpart
+            for k in range(u - prev_u):
+                pair(prev_u + k, prev_v + k)
+        else:
+            _opcodes(text, new_text, i1, i2, j1, j2, level + 1, ops, budget)
+        if u < len(units):
+            pair(u, v)
+        prev_u, prev_v = u + 1, v + 1
+
+
+def _subsequence_opcodes(text, new_text, i, i_end, j, j_end, ops):
+    # If `text[i:i_end]` only lost characters to become `new_text[j:j_end]`
+    # (or only gained some), append the edits to `ops` and return True. The
+    # characters are matched as early as they can be
+    deleting = i_end - i >= j_end - j
+    if deleting:
+        long_text, long_ix, long_end = text, i, i_end
+        short_text, short_ix, short_end = new_text, j, j_end
+    else:
+        long_text, long_ix, long_end = new_text, j, j_end
+        short_text, short_ix, short_end = text, i, i_end
+    # Runs of matched characters, as `[long_start, short_start, length]`
+    runs = []
+    pos = long_ix
+    for ix in range(short_ix, short_end):
+        found = long_text.find(short_text[ix], pos, long_end)
+        if found == -1:
+            return False
+        if runs and runs[-1][0] + runs[-1][2] == found:
+            runs[-1][2] += 1
+        else:
+            runs.append([found, ix, 1])
+        pos = found + 1
+    runs.append([long_end, short_end, 0])
+
+    for long_start, short_start, length in runs:
+        # The characters skipped before the run, then the run
+        if long_start > long_ix:
+            if deleting:
+                ops.append(('delete', long_ix, long_start,
+                            short_start, short_start))
+            else:
+                ops.append(('insert', short_start, short_start,
+                            long_ix, long_start))
+        if length:
+            if deleting:
+                ops.append(('equal', long_start, long_start + length,
+                            short_start, short_start + length))
+            else:
+                ops.append(('equal', short_start, short_start + length,
+                            long_start, long_start + length))
+        long_ix = long_start + length
+    return True
+
+
+def _insertion_bounds(text, new_text, i, j1, j2):
+    # The start and end offsets of `i`, where `new_text[j1:j2]` was
+    # inserted: inserted text is left out of the spans that start or end at
+    # `i`, unless it continues the word before, or starts the word after
+    inserted = new_text[j1:j2]
+    word_before = i > 0 and text[i - 1].isalnum()
+    word_after = i < len(text) and text[i].isalnum()
+    if word_before and not word_after and inserted[0].isalnum():
+        return j2, j2
+    if word_after and not word_before and inserted[-1].isalnum():
+        return j1, j1
+    return j2, j1
+
+
+def align(text, new_text):
+    """Return the `OffsetMap` from `text` to `new_text`.
+
+    The texts are matched by lines, words, then characters (see the
+    module docstring). Offsets inside a replaced stretch of characters are
+    spread evenly over its replacement, so changes that keep the length of
+    a word (such as changes of case) map it one to one. Text inserted where
+    a span starts or ends is left out of it, unless the insertion continues
+    or starts the word the span is on.
+
+    Raises `AlignmentError` if the texts differ too much to be matched
+    within `MAX_MATCH_WORK`.
+    """
+    text_len = len(text)
+    new_len = len(new_text)
+    if text_len == new_len and text.lower() == new_text.lower():
+        return OffsetMap.identity(text_len)
+    ops = []
+    _opcodes(text, new_text, 0, text_len, 0, new_len, 0, ops,
+             [MAX_MATCH_WORK])
+
+    starts = array('q', bytes(8 * (text_len + 1)))
+    ends = array('q', bytes(8 * (text_len + 1)))
+    # The offset text was last inserted at, and where that text starts and
+    # ends in `new_text`
+    inserted = None
+    for tag, i1, i2, j1, j2 in ops:
+        if i1 == i2:
+            if j1 < j2:
+                if inserted is not None and inserted[0] == i1:
+                    inserted = (i1, inserted[1], j2)
+                else:
+                    inserted = (i1, j1, j2)
+            continue
+        if tag == 'equal' or i2 - i1 == j2 - j1:
+            offsets = array('q', range(j1, j2))
+            starts[i1:i2] = offsets
+            ends[i1:i2] = offsets
+        else:
+            # Replaced, or deleted (`j1 == j2`)
+            di = i2 - i1
+            dj = j2 - j1
+            for k in range(di):
+                starts[i1 + k] = ends[i1 + k] = j1 + k * dj // di
+        if inserted is not None and inserted[0] == i1:
+            starts[i1], ends[i1] = _insertion_bounds(
+                text, new_text, *inserted)
+    starts[text_len] = ends[text_len] = new_len
+    if inserted is not None and inserted[0] == text_len:
+        ends[text_len] = _insertion_bounds(text, new_text, *inserted)[1]
+    return OffsetMap(starts, ends)
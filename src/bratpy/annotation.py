@@ -11,7 +11,10 @@
 # #     text=None,        # provides the text instead of loading from `.txt` file
 # #     read_only=False,  # if True, the document will not be saved
 # #     lock_dir=None,    # lock file directory (system tmp dir if None)
-# #     source=None)      # provides the annotations instead of loading from `.ann` file
+# #     source=None,      # provides the annotations instead of loading from `.ann` file
+# #     thread_safe=False,  # if True, can be shared between threads (slower)
+# #     stats=None,       # collect timings and counters (default: see `enable_stats`)
+# #     messages=None)    # `MessageCollector` to use (e.g. a disabled one)
 #
 # # TextBoundAnnotationWithText(
 # #     spans,            # list of (start, end) pairs
@@ -33,15 +36,33 @@
 # # .get_statuses()
 # # .get_triggers()
 # # .add_annotation(ann)
+# # .add_annotations(anns)
+# # .batch()            # context; defers bookkeeping, rolls back on error
 # # .del_annotation(ann)
+# # .modify_annotation(ann, **fields)  # returns the replacing annotation
+# # .undo()
+# # .redo()
+# # .version            # incremented by every change
+# # .get_changes(since)  # `Change`s after version `since`
+# # .add_change_listener(callback)
+# # .snapshot()         # O(1) read-only view, unaffected by later changes
 # # .get_ann_by_id(id)
 # # .get_new_id(prefix, suffix=None)
 # # .get_document_text()
+# # .apply_edits(edits)  # [(pos, delete_len, insert_text)]; shifts the spans
 # # .save(document=None)
+# # .get_stats()        # dict of timers and counters, if collected
 # # .get_messages()
 # #   .ok
-# #   .errors
+# #   .errors           # `Message`s (str, with .code, .line_num, .ann_id)
 # #   .warnings
+# #   .dropped_errors   # not collected (over the limit, or disabled)
+# #   .dropped_warnings
+#
+# # enable_stats(hook=None)  # collect stats for documents loaded from now on
+# # disable_stats()
+# # get_global_stats()       # stats summed over all documents
+# # reset_global_stats()
 #
 # # Available annotations:
 # #
@@ -118,16 +139,22 @@
 
 from __future__ import with_statement
 
-from codecs import open as codecs_open
-from itertools import chain, takewhile
-from os import close as os_close
-from os import access, W_OK
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from copy import copy
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, islice, takewhile
+from os import access, scandir, stat, W_OK
 from os.path import join as path_join
-from os.path import splitext, dirname, isfile, isdir, exists
+from os.path import splitext, basename, dirname, isfile, isdir, exists, getsize
 from re import compile as re_compile
 from re import match as re_match
-from time import time
+from threading import Condition, Lock, get_ident
+from time import perf_counter, sleep, time
+
 
+# Default maximum number of errors, and of warnings, collected per document
+MESSAGE_LIMIT = 1000
 
 try:
     from common import ProtocolError
@@ -143,22 +170,69 @@ except (ModuleNotFoundError, ImportError):
     ProtocolError = Exception
 
     import contextlib
-    class MessageCollection:
-        def __init__(self):
-            self.ok = True
-            self.errors = []
-            self.warnings = []
 
-    class MessageCollector(object):
-        def __init__(self):
-            self.messages = MessageCollection()
 
-        def error(self, message, timeout=None):
-            self.messages.ok = False
-            self.messages.errors.append(message)
+class Message(str):
+    """A collected error or warning: its text, with `code` identifying the
+    kind of problem, and `line_num` (1-based) and `ann_id` locating it, if
+    known. The text (`template % args`) is only formatted for the messages
+    collected, not for those over the limit.
+    """
+
+    def __new__(cls, template, args=(), code=None, line_num=None,
+                ann_id=None):
+        self = str.__new__(cls, template % args if args else template)
+        self.template = template
+        self.args = args
+        self.code = code
+        self.line_num = line_num
+        self.ann_id = ann_id
+        return self
+
+
+class MessageCollection:
+    def __init__(self):
+        self.ok = True
+        self.errors = []
+        self.warnings = []
+        # Number of messages not collected, over the limit or when disabled
+        self.dropped_errors = 0
+        self.dropped_warnings = 0
 
-        def warning(self, message, timeout=None):
-            self.messages.warnings.append(message)
+
+class MessageCollector(object):
+    """Collects `Message`s, up to `max_errors` errors and `max_warnings`
+    warnings (None for no limit); the rest are only counted. If not
+    `enabled`, nothing is collected, but `ok` still reflects errors.
+    """
+
+    def __init__(self, enabled=True, max_errors=MESSAGE_LIMIT,
+                 max_warnings=MESSAGE_LIMIT):
+        self.messages = MessageCollection()
+        self.enabled = enabled
+        self.max_errors = max_errors
+        self.max_warnings = max_warnings
+
+    def error(self, message, timeout=None, args=(), code=None,
+              line_num=None, ann_id=None):
+        messages = self.messages
+        messages.ok = False
+        if not self.enabled or (self.max_errors is not None and
+                                len(messages.errors) >= self.max_errors):
+            messages.dropped_errors += 1
+            return
+        messages.errors.append(
+            Message(message, args, code, line_num, ann_id))
+
+    def warning(self, message, timeout=None, args=(), code=None,
+                line_num=None, ann_id=None):
+        messages = self.messages
+        if not self.enabled or (self.max_warnings is not None and
+                                len(messages.warnings) >= self.max_warnings):
+            messages.dropped_warnings += 1
+            return
+        messages.warnings.append(
+            Message(message, args, code, line_num, ann_id))
 
 
 '''
@@ -181,6 +255,8 @@ KNOWN_FILE_SUFF = [JOINED_ANN_FILE_SUFF] + PARTIAL_ANN_FILE_SUFF
 TEXT_FILE_SUFFIX = 'txt'
 # String used to catenate texts of discontinuous annotations in reference text
 DISCONT_SEP = ' '
+# Number of most recent changes remembered for undo and change feeds
+JOURNAL_LIMIT = 10000
 ###
 
 # If True, use BioNLP Shared Task 2013 compatibilty mode, allowing
@@ -360,15 +436,20 @@ class SpanOffsetOverlapError(AnnotationError):
 
 # Open function that enforces strict, utf-8, and universal newlines for reading
 # TODO: Could have another wrapping layer raising an appropriate AnnotationError
-def open_textfile(filename, mode='rU'):
-    # enforce universal newline support ('U') in read modes
-    if len(mode) != 0 and mode[0] == 'r' and 'U' not in mode:
-        mode = mode + 'U'
-    return codecs_open(filename, mode, encoding='utf8', errors='strict')
+def open_textfile(filename, mode='r'):
+    # Universal newline support is the default in text read modes ('U' is
+    # no longer accepted since Python 3.11); write exactly what is given
+    mode = mode.replace('U', '')
+    newline = None if 'r' in mode else ''
+    return open(filename, mode, encoding='utf8', errors='strict',
+                newline=newline)
+
+
+_ANNOTATION_ID_RE = re_compile(r'^([A-Za-z]+|#[A-Za-z]*)([0-9]+)(.*?)$')
 
 
 def __split_annotation_id(id):
-    m = re_match(r'^([A-Za-z]+|#[A-Za-z]*)([0-9]+)(.*?)$', id)
+    m = _ANNOTATION_ID_RE.match(id)
     if m is None:
         raise InvalidIdError(id)
     pre, num_str, suf = m.groups()
@@ -440,16 +521,22 @@ class Annotations(object):
         if not input_files:
             # Our first attempts at finding the input by checking suffixes
             # failed, so we try to attach know suffixes to the path.
-            sugg_path = document + '.' + JOINED_ANN_FILE_SUFF
-            if isfile(sugg_path):
+            # A whole corpus directory is listed at once, rather than
+            # checking each suffix of each document.
+            suffs = _ann_file_suffixes(dirname(document) or '.').get(
+                basename(document))
+            if not suffs:
+                # The listing could be slightly stale; make sure
+                suffs = set(suff for suff in KNOWN_FILE_SUFF
+                            if isfile(document + '.' + suff))
+            if JOINED_ANN_FILE_SUFF in suffs:
                 # We found a joined file by adding the joined suffix
-                input_files = [sugg_path]
+                input_files = [document + '.' + JOINED_ANN_FILE_SUFF]
             else:
                 # Our last shot, we go for as many partial files as possible
-                input_files = [sugg_path for sugg_path in
-                               (document + '.' + suff
-                                for suff in PARTIAL_ANN_FILE_SUFF)
-                               if isfile(sugg_path)]
+                input_files = [document + '.' + suff
+                               for suff in PARTIAL_ANN_FILE_SUFF
+                               if suff in suffs]
                 if not PROGRAMMATIC:
                     self._read_only = True
 
@@ -465,16 +552,80 @@ class Annotations(object):
         def get_messages(self):
             return self.messages.messages
 
-    def _init_messager(self):
-        if not hasattr(self, 'messager'):
-            if PROGRAMMATIC:
+    def _init_messager(self, messages=None):
+        if not hasattr(self, 'messages'):
+            if messages is not None:
+                self.messages = messages
+            elif PROGRAMMATIC:
                 self.messages = MessageCollector()
             else:
                 self.messages = Messager
 
+    def _error(self, code, template, *args, **details):
+        self._message('error', code, template, args, **details)
+
+    def _warning(self, code, template, *args, **details):
+        self._message('warning', code, template, args, **details)
+
+    def _message(self, kind, code, template, args, line_num=None,
+                 ann_id=None, timeout=None):
+        messages = self.messages
+        if isinstance(messages, MessageCollector):
+            # Formatted only if collected
+            getattr(messages, kind)(template, timeout, args, code, line_num,
+                                    ann_id)
+        else:
+            if args:
+                template = template % args
+            if timeout is None:
+                getattr(messages, kind)(template)
+            else:
+                getattr(messages, kind)(template, timeout)
+
+    def _init_stats(self, stats):
+        if not hasattr(self, '_stats'):
+            if stats is None:
+                stats = _stats_enabled
+            self._stats = Stats() if stats else None
+
+    def _timed(self, phase, func):
+        timers = self._stats.timers
+
+        def timed(*args):
+            start = perf_counter()
+            try:
+                return func(*args)
+            finally:
+                timers[phase] += perf_counter() - start
+        return timed
+
+    def _report_stats(self, event, before=None):
+        # Adds the stats of the finished operation to the global ones
+        delta = self._stats.as_dict()
+        if before is not None:
+            for kind, values in delta.items():
+                for name in values:
+                    values[name] -= before[kind].get(name, 0)
+        GLOBAL_STATS.add(delta)
+        if _stats_hook is not None:
+            _stats_hook(self, event, delta)
+
+    def get_stats(self):
+        """Return the timers (seconds by phase) and counters collected for
+        this document as `{'timers': {...}, 'counters': {...}}`, or None if
+        stats are not being collected (see `enable_stats`)."""
+        if self._stats is None:
+            return None
+        return self._stats.as_dict()
+
 
     # TODO: DOC!
-    def __init__(self, document=None, read_only=False, lock_dir=None, source=None):
+    def __init__(self, document=None, read_only=False, lock_dir=None, source=None,
+                 thread_safe=False, stats=None, messages=None):
+        # Mutations take the write lock, accessors the read lock
+        self._lock = ReadWriteLock() if thread_safe else NULL_LOCK
+        self._init_stats(stats)
+
         if lock_dir is None:
             if PROGRAMMATIC:
                 from tempfile import gettempdir
@@ -482,7 +633,7 @@ class Annotations(object):
             else:
                 lock_dir = WORK_DIR
 
-        self._init_messager()
+        self._init_messager(messages)
 
         self.lock_dir = lock_dir
 
@@ -498,6 +649,10 @@ class Annotations(object):
             'E': self._parse_event_annotation,
             '#': self._parse_comment_annotation,
         }
+        if self._stats is not None:
+            # Textbounds are verified against the text by `TextAnnotations`
+            self._parse_function_by_id_prefix['T'] = self._timed(
+                'verify_textbounds', self._parse_textbound_annotation)
 
         # TODO: DOC!
         # TODO: Incorparate file locking! Is the destructor called upon inter
@@ -524,6 +679,18 @@ class Annotations(object):
         # Annotation by id, not includid non-ided annotations
         self._ann_by_id = {}
         ###
+        # Saved state of the outermost `batch()` in progress, if any
+        self._batch_state = None
+        # Changes are only journalled once the document is loaded
+        self._journal = None
+        # Names of the containers (`_lines`, `_ann_by_id`) that are also used
+        # by a snapshot
+        self._shared = set()
+        self._write_seq = 0
+        self._write_depth = 0
+        self._writer = None
+        # `SpanIndex` of the text-bounds, built on demand
+        self._span_index = None
 
         # We use some heuristics to find the appropriate annotation files
         self._read_only = read_only
@@ -547,13 +714,25 @@ class Annotations(object):
 
         # Finally, parse the given annotation file
         self.ann_line_num = -1
-        if input_files:
-            self._parse_ann_file(input_files)
-        elif source:
-            self._parse_ann_lines(source.splitlines(keepends=True))
+        stats = self._stats
+        if stats is not None:
+            start = perf_counter()
+        with self.batch():
+            if input_files:
+                self._parse_ann_file(input_files)
+            elif source:
+                self._parse_ann_lines(source.splitlines(keepends=True))
+        if stats is not None:
+            stats.timers['parse'] += perf_counter() - start
+            stats.count('lines_parsed', self.ann_line_num + 1)
+            stats.count('failed_lines', len(self.failed_lines))
+            start = perf_counter()
 
         # Sanity checking that can only be done post-parse
         self._sanity()
+        if stats is not None:
+            stats.timers['sanity'] += perf_counter() - start
+        self._journal = Journal()
         # XXX: Hack to get the timestamps after parsing
         if (document is not None and
                 len(self._input_files) == 1 and
@@ -565,6 +744,9 @@ class Annotations(object):
             self.ann_mtime = -1
             self.ann_ctime = -1
 
+        if stats is not None:
+            self._report_stats('load')
+
     def _sanity(self):
         # Beware, we ONLY do format checking, leave your semantics hat at home
 
@@ -575,11 +757,13 @@ class Annotations(object):
                     self.get_ann_by_id(rid)
                 except AnnotationNotFoundError:
                     # TODO: do more than just send a message for this error?
-                    self.messages.error(
-                        'ID ' +
-                        rid +
-                        ' not defined, referenced from annotation ' +
-                        str(ann))
+                    line_num = self._line_by_ann.get(ann)
+                    self._error(
+                        'undefined-id',
+                        'ID %s not defined, referenced from annotation %s',
+                        rid, ann,
+                        line_num=None if line_num is None else line_num + 1,
+                        ann_id=getattr(ann, 'id', None))
 
         # Check that each event has a trigger
         for e_ann in self.get_events():
@@ -676,6 +860,13 @@ class Annotations(object):
         if not read and self._read_only:
             raise AnnotationsIsReadOnlyError(self.get_document())
 
+        self._begin_write()
+        try:
+            self._add_annotation(ann, read)
+        finally:
+            self._end_write()
+
+    def _add_annotation(self, ann, read):
         # Equivs have to be merged with other equivs
         try:
             # Bail as soon as possible for non-equivs
@@ -691,9 +882,14 @@ class Annotations(object):
                 # Do we have an entitiy in common with this equiv?
                 for ent in merge_cand.entities:
                     if ent in eq_ann.entities:
+                        merged_entities = list(eq_ann.entities)
                         for m_ent in merge_cand.entities:
-                            if m_ent not in eq_ann.entities:
-                                eq_ann.entities.append(m_ent)
+                            if m_ent not in merged_entities:
+                                merged_entities.append(m_ent)
+                        merged_ann = copy(eq_ann)
+                        merged_ann.entities = merged_entities
+                        self._replace_annotation(eq_ann, merged_ann)
+                        eq_ann = merged_ann
                         # Don't try to delete ann since it never was added
                         if merge_cand != ann:
                             try:
@@ -708,8 +904,9 @@ class Annotations(object):
             if merge_cand != ann:
                 # The proposed annotation was simply merged, no need to add it
                 # Update the modification time
-                from time import time
-                self.ann_mtime = time()
+                if self._batch_state is None:
+                    from time import time
+                    self.ann_mtime = time()
                 return
 
         except AttributeError:
@@ -717,25 +914,134 @@ class Annotations(object):
             # It was not an Equiv, skip along
             pass
 
+        # Duplicate ids are rejected before anything changes, whether in a
+        # batch or not
+        if not read and getattr(ann, 'id', None) in self._ann_by_id:
+            raise DuplicateAnnotationIdError(
+                ann.id, str(ann), len(self) + 1, ann.source_id)
+
+        batch = self._batch_state
         # Register the object id
         try:
-            self._ann_by_id[ann.id] = ann
-            pre, num = annotation_id_prefix(
-                ann.id), annotation_id_number(
-                ann.id)
-            self._max_id_num_by_prefix[pre] = max(
-                int(num), int(self._max_id_num_by_prefix[pre]))
+            id = ann.id
+            self._unshare('_ann_by_id')
+            if batch is not None:
+                # Id bookkeeping is done in bulk when the batch ends
+                self._ann_by_id[id] = ann
+                batch.new_ids.append(id)
+            else:
+                self._ann_by_id[id] = ann
+                pre, num = annotation_id_prefix(
+                    ann.id), annotation_id_number(
+                    ann.id)
+                self._max_id_num_by_prefix[pre] = max(
+                    int(num), int(self._max_id_num_by_prefix[pre]))
         except AttributeError:
             # The annotation simply lacked an id which is fine
             pass
 
         # Add the annotation as the last line
+        self._unshare('_lines')
         self._lines.append(ann)
+        self._record(Change.ADDED, len(self) - 1, ann)
+        if batch is not None:
+            # The line index and modification time are updated at batch end
+            return
         self._line_by_ann[ann] = len(self) - 1
         # Update the modification time
         from time import time
         self.ann_mtime = time()
 
+    def add_annotations(self, anns, read=False):
+        """Add all annotations from the iterable `anns` in a single batch.
+
+        Either all of them are added, or (if any fails) none are.
+        """
+        with self.batch():
+            for ann in anns:
+                self.add_annotation(ann, read=read)
+
+    @contextmanager
+    def batch(self):
+        """Context manager grouping several mutations together.
+
+        Inside the block, id bookkeeping, the line index and the modification
+        time are not maintained per annotation, but updated once when the
+        block exits. If an exception escapes the block (including a duplicate
+        id, or an invalid id detected at its end), the annotations are rolled
+        back to the state they were in when the block was entered.
+
+        Nested batches are merged into the outermost one.
+        """
+        self._begin_write()
+        if self._batch_state is not None:
+            # With the write lock held, an open batch can only be ours
+            try:
+                yield self
+            finally:
+                self._end_write()
+            return
+
+        self._batch_state = _BatchState(self)
+        try:
+            yield self
+            self._commit_batch()
+        except BaseException:
+            try:
+                self._rollback_batch()
+            finally:
+                self._batch_state = None
+            self._end_write(discard=True)
+            raise
+        self._batch_state = None
+        self._end_write()
+
+    def _flush_batch_lines(self):
+        # Index the lines appended since the batch started (or was last
+        # flushed), so that code needing `_line_by_ann` can run mid-batch
+        batch = self._batch_state
+        if batch is None:
+            return
+        for l_num in range(batch.unindexed_from, len(self)):
+            self._line_by_ann[self._lines[l_num]] = l_num
+        batch.unindexed_from = len(self)
+
+    def _commit_batch(self):
+        batch = self._batch_state
+
+        # Validate all new ids before touching any state
+        max_num_by_prefix = {}
+        for id in batch.new_ids:
+            m = _ANNOTATION_ID_RE.match(id)
+            if m is None:
+                raise InvalidIdError(id)
+            pre, num = m.group(1), int(m.group(2))
+            if num > max_num_by_prefix.get(pre, 0):
+                max_num_by_prefix[pre] = num
+        for pre, num in max_num_by_prefix.items():
+            self._max_id_num_by_prefix[pre] = max(
+                num, int(self._max_id_num_by_prefix[pre]))
+
+        self._flush_batch_lines()
+        self.ann_mtime = time()
+
+    def _rollback_batch(self):
+        # Undo the changes of the batch one by one, without journalling them
+        batch = self._batch_state
+        self._flush_batch_lines()
+        self._batch_state = None
+        journal, self._journal = self._journal, None
+        try:
+            for change in reversed(batch.changes):
+                self._apply_change(change.inverse())
+        finally:
+            self._journal = journal
+        self._max_id_num_by_prefix = batch.max_id_num_by_prefix
+        if batch.ann_mtime is not None:
+            self.ann_mtime = batch.ann_mtime
+        # The version goes back too, so the index could pass for current
+        self._span_index = None
+
     def del_annotation(self, ann, tracker=None):
         # TODO: Check read only
         # TODO: Flag to allow recursion
@@ -746,16 +1052,21 @@ class Annotations(object):
         if self._read_only:
             raise AnnotationsIsReadOnlyError(self.get_document())
 
+        self._begin_write()
+        try:
+            self._del_annotation(ann, tracker)
+        finally:
+            self._end_write()
+
+    def _del_annotation(self, ann, tracker):
         try:
             ann.id
         except AttributeError:
             # If it doesn't have an id, nothing can depend on it
             if tracker is not None:
                 tracker.deletion(ann)
+            # Also updates the modification time, unless in a batch
             self._atomic_del_annotation(ann)
-            # Update the modification time
-            from time import time
-            self.ann_mtime = time()
             return
 
         # collect annotations dependending on ann
@@ -793,9 +1104,13 @@ class Annotations(object):
                     else:
                         if tracker is not None:
                             before = str(d)
-                        d.entities.remove(str(ann.id))
+                        entities = list(d.entities)
+                        entities.remove(str(ann.id))
+                        new_d = copy(d)
+                        new_d.entities = entities
+                        self._replace_annotation(d, new_d)
                         if tracker is not None:
-                            tracker.change(before, d)
+                            tracker.change(before, new_d)
                 elif isinstance(d, OnelineCommentAnnotation):
                     # TODO: Can't anything refer to comments?
                     self._atomic_del_annotation(d)
@@ -822,30 +1137,255 @@ class Annotations(object):
 
     def _atomic_del_annotation(self, ann):
         # TODO: DOC
+        self._flush_batch_lines()
         # Erase the ann by id shorthand
         try:
-            del self._ann_by_id[ann.id]
+            id = ann.id
+            self._unshare('_ann_by_id')
+            del self._ann_by_id[id]
         except AttributeError:
             # So, we did not have id to erase in the first place
             pass
 
         ann_line = self._line_by_ann[ann]
         # Erase the main annotation
+        self._unshare('_lines')
         del self._lines[ann_line]
         # Erase the ann by line shorthand
         del self._line_by_ann[ann]
+        self._record(Change.DELETED, ann_line, ann)
         # Update the line shorthand of every annotation after this one
         # to reflect the new self._lines
         for l_num in range(ann_line, len(self)):
             self._line_by_ann[self[l_num]] = l_num
+        if self._batch_state is not None:
+            self._batch_state.unindexed_from = len(self)
+            return
         # Update the modification time
         from time import time
         self.ann_mtime = time()
 
+    def modify_annotation(self, ann, tracker=None, **fields):
+        """Change the given fields of an annotation, e.g.
+        `doc.modify_annotation(ann, type="Protein")`.
+
+        Annotations are never changed in place: `ann` is replaced on its line
+        by a modified copy, which is returned.
+        """
+        if self._read_only:
+            raise AnnotationsIsReadOnlyError(self.get_document())
+
+        new_ann = copy(ann)
+        for name, value in fields.items():
+            setattr(new_ann, name, value)
+        if tracker is not None:
+            tracker.change(str(ann), new_ann)
+        self._begin_write()
+        try:
+            self._replace_annotation(ann, new_ann)
+        finally:
+            self._end_write()
+        return new_ann
+
+    def _replace_annotation(self, old_ann, new_ann):
+        self._flush_batch_lines()
+        self._unshare('_lines')
+        ann_line = self._line_by_ann.pop(old_ann)
+        self._lines[ann_line] = new_ann
+        self._line_by_ann[new_ann] = ann_line
+        try:
+            if self._ann_by_id.get(old_ann.id) is old_ann:
+                self._unshare('_ann_by_id')
+                del self._ann_by_id[old_ann.id]
+        except AttributeError:
+            pass
+        try:
+            id = new_ann.id
+            self._unshare('_ann_by_id')
+            self._ann_by_id[id] = new_ann
+        except AttributeError:
+            pass
+        self._record(Change.MODIFIED, ann_line, new_ann, old_ann)
+        if self._batch_state is None:
+            self.ann_mtime = time()
+
+    def _insert_annotation(self, ann_line, ann):
+        # Inverse of `_atomic_del_annotation`
+        self._flush_batch_lines()
+        self._unshare('_lines')
+        self._lines.insert(ann_line, ann)
+        for l_num in range(ann_line, len(self)):
+            self._line_by_ann[self._lines[l_num]] = l_num
+        try:
+            id = ann.id
+            self._unshare('_ann_by_id')
+            self._ann_by_id[id] = ann
+        except AttributeError:
+            pass
+        self._record(Change.ADDED, ann_line, ann)
+        if self._batch_state is None:
+            self.ann_mtime = time()
+        else:
+            self._batch_state.unindexed_from = len(self)
+
+    def _record(self, kind, ann_line, ann, old_ann=None):
+        if self._batch_state is not None:
+            self._batch_state.changes.append(
+                Change(None, kind, ann_line, ann, old_ann))
+        if self._journal is not None:
+            self._journal.record(kind, ann_line, ann, old_ann)
+
+    # Every public mutation runs in a write section, which is one journal
+    # group (one undo step). `_write_seq` is odd while a section is open, so
+    # that `snapshot` can tell whether it might have seen a half-done change.
+    def _begin_write(self):
+        self._lock.acquire_write()
+        if self._write_depth == 0:
+            self._writer = get_ident()
+            self._write_seq += 1
+        self._write_depth += 1
+        if self._journal is not None:
+            self._journal.begin()
+
+    def _end_write(self, discard=False):
+        self._write_depth -= 1
+        if self._write_depth == 0:
+            self._write_seq += 1
+            self._writer = None
+        # Listeners are called from here, so they can take snapshots
+        try:
+            if self._journal is not None:
+                if discard:
+                    self._journal.discard()
+                else:
+                    self._journal.end()
+        finally:
+            self._lock.release_write()
+
+    def _unshare(self, name):
+        # Copy-on-write: the first change to a container after a snapshot
+        # gives the document its own copy, leaving the old one to the
+        # snapshot(s); containers that are not changed are never copied
+        if name in self._shared:
+            setattr(self, name, copy(getattr(self, name)))
+            self._shared.discard(name)
+
+    def _get_span_index(self):
+        # Kept until the next change
+        index = self._span_index
+        if index is None or index.version != self.version:
+            index = SpanIndex(self.get_textbounds(), self.version)
+            self._span_index = index
+        return index
+
+    def snapshot(self):
+        """Return a read-only view of the current state of the annotations.
+
+        Taking a snapshot is O(1): it shares its containers with the
+        document, which copies each of them before it next changes it. The
+        snapshot is unaffected by later changes, as long as annotations are
+        only changed through the document (e.g. `modify_annotation`), not by
+        assigning to their fields.
+
+        It is safe to take snapshots while another thread is changing the
+        document (as long as writers do not run concurrently with each
+        other); a snapshot never reflects a half-done change. Readers of
+        snapshots never hold up writers.
+        """
+        with self._lock.read:
+            while True:
+                seq = self._write_seq
+                if not seq % 2 or self._writer == get_ident():
+                    lines, ann_by_id = self._lines, self._ann_by_id
+                    text = getattr(self, '_document_text', None)
+                    version = self.version
+                    self._shared = {'_lines', '_ann_by_id'}
+                    if self._write_seq == seq:
+                        return AnnotationsSnapshot(
+                            self._document, lines, ann_by_id, text, version)
+                # A change is in progress in another thread; let it finish
+                sleep(0)
+
+    def _apply_change(self, change):
+        if change.kind == Change.ADDED:
+            self._insert_annotation(change.line, change.ann)
+        elif change.kind == Change.DELETED:
+            self._atomic_del_annotation(change.ann)
+        elif change.kind == Change.TEXT:
+            self._splice_text(change.line, change.old_ann, change.ann)
+        else:
+            self._replace_annotation(change.old_ann, change.ann)
+
+    def undo(self):
+        """Revert the most recent change (a whole batch, or a deletion with
+        all the annotations deleted along with it, counts as one).
+
+        Returns False if there was nothing to undo.
+        """
+        if self._read_only:
+            raise AnnotationsIsReadOnlyError(self.get_document())
+        self._begin_write()
+        try:
+            # Only checked with the write lock held, as another thread may be
+            # in the middle of a batch
+            if self._batch_state is not None:
+                raise AnnotationError('Cannot undo inside a batch')
+            return self._journal.undo(self._apply_change)
+        finally:
+            self._end_write()
+
+    def redo(self):
+        """Reapply the most recently undone change.
+
+        Returns False if there was nothing to redo.
+        """
+        if self._read_only:
+            raise AnnotationsIsReadOnlyError(self.get_document())
+        self._begin_write()
+        try:
+            # Only checked with the write lock held, as another thread may be
+            # in the middle of a batch
+            if self._batch_state is not None:
+                raise AnnotationError('Cannot redo inside a batch')
+            return self._journal.redo(self._apply_change)
+        finally:
+            self._end_write()
+
+    @property
+    def version(self):
+        """Number of changes made since the document was loaded."""
+        return self._journal.version
+
+    def get_changes(self, since=0):
+        """Return the list of `Change`s made after version `since`, in
+        order, or None if they are no longer all remembered (see
+        `JOURNAL_LIMIT`)."""
+        with self._lock.read:
+            return self._journal.since(since)
+
+    def add_change_listener(self, listener):
+        """Call `listener(change)` for every `Change`, once the operation
+        (or batch) that made it is complete. Undo and redo also produce
+        changes."""
+        self._journal.listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        self._journal.listeners.remove(listener)
+
     def get_ann_by_id(self, id):
         # TODO: DOC
+        # Without the lock if no change is in progress, before or after (see
+        # `snapshot`)
+        seq = self._write_seq
+        if not seq % 2:
+            ann = self._ann_by_id.get(id)
+            if self._write_seq == seq:
+                if ann is None:
+                    raise AnnotationNotFoundError(id)
+                return ann
         try:
-            return self._ann_by_id[id]
+            with self._lock.read:
+                return self._ann_by_id[id]
         except KeyError:
             raise AnnotationNotFoundError(id)
 
@@ -874,16 +1414,18 @@ class Annotations(object):
         if suffix is None:
             suffix = ''
         # XXX: Arbitrary constant!
-        for suggestion in (
-            prefix +
-            str(i) +
-            suffix for i in range(
-                1,
-                2**15)):
-            # This is getting more complicated by the minute, two checks since
-            # the developers no longer know when it is an id or string.
-            if suggestion not in self._ann_by_id:
-                return suggestion
+        with self._lock.read:
+            for suggestion in (
+                prefix +
+                str(i) +
+                suffix for i in range(
+                    1,
+                    2**15)):
+                # This is getting more complicated by the minute, two checks
+                # since the developers no longer know when it is an id or
+                # string.
+                if suggestion not in self._ann_by_id:
+                    return suggestion
 
     # XXX: This syntax is subject to change
     def _parse_attribute_annotation(
@@ -959,14 +1501,18 @@ class Annotations(object):
                 id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
         if len(args) != 2:
-            self.messages.error(
-                'Error parsing relation: must have exactly two arguments')
+            self._error(
+                'relation-arg-count',
+                'Error parsing relation: must have exactly two arguments',
+                line_num=self.ann_line_num + 1, ann_id=id)
             raise IdedAnnotationLineSyntaxError(
                 id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
         if args[0][0] == args[1][0]:
-            self.messages.error(
-                'Error parsing relation: arguments must not be identical')
+            self._error(
+                'relation-identical-args',
+                'Error parsing relation: arguments must not be identical',
+                line_num=self.ann_line_num + 1, ann_id=id)
             raise IdedAnnotationLineSyntaxError(
                 id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
@@ -1015,9 +1561,11 @@ class Annotations(object):
                 end_str = end_str.rstrip()
 
                 if any((c.isspace() for c in end_str)):
-                    self.messages.error(
-                        'Error parsing textbound "%s\t%s". (Using space instead of tab?)' %
-                        (id, data))
+                    self._error(
+                        'textbound-syntax',
+                        'Error parsing textbound "%s\t%s". (Using space instead of tab?)',
+                        id, data,
+                        line_num=self.ann_line_num + 1, ann_id=id)
                     raise IdedAnnotationLineSyntaxError(
                         id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
@@ -1074,7 +1622,9 @@ class Annotations(object):
     def _parse_ann_file(self, input_files):
         for input_file_path in input_files:
             with open_textfile(input_file_path) as input_file:
-                ann_lines = input_file.readlines()
+                ann_lines = _split_lines(input_file.read())
+                if self._stats is not None:
+                    self._stats.count('bytes_read', getsize(input_file_path))
                 self._parse_ann_lines(ann_lines, input_file_path)
 
     def _parse_ann_lines(self, ann_lines, input_file_path=None):
@@ -1150,26 +1700,35 @@ class Annotations(object):
                 self.failed_lines.append(e.line_num - 1)
 
     def __str__(self):
-        s = u'\n'.join(str(ann).rstrip(u'\r\n') for ann in self)
-        if not s:
-            return u''
-        else:
-            return s if s[-1] == u'\n' else s + u'\n'
-
-    def __it__(self):
-        for ann in self._lines:
-            yield ann
+        return _anns_to_str(self)
+
+    def __iter__(self):
+        if self._lock is NULL_LOCK:
+            return iter(self._lines)
+        # Iterate over a copy of the lines, so that the lock is not held (and
+        # writers blocked) for the whole iteration. Copying here is cheaper
+        # than marking the lines shared: the next change would then copy the
+        # id index as well
+        seq = self._write_seq
+        if not seq % 2:
+            lines = list(self._lines)
+            if self._write_seq == seq:
+                return iter(lines)
+        with self._lock.read:
+            return iter(list(self._lines))
 
     def __getitem__(self, val):
-        try:
-            # First, try to use it as a slice object
-            return self._lines[val.start, val.stop, val.step]
-        except AttributeError:
-            # It appears not to be a slice object, try it as an index
-            return self._lines[val]
+        with self._lock.read:
+            try:
+                # First, try to use it as a slice object
+                return self._lines[val.start, val.stop, val.step]
+            except AttributeError:
+                # It appears not to be a slice object, try it as an index
+                return self._lines[val]
 
     def __len__(self):
-        return len(self._lines)
+        with self._lock.read:
+            return len(self._lines)
 
     def __enter__(self):
         # No need to do any handling here, the constructor handles that
@@ -1197,18 +1756,46 @@ class Annotations(object):
         if self._read_only:
             raise Exception("Cannot save, read only")
 
-        assert len(self._input_files) == 1, 'more than one valid outfile'
+        assert self._input_files, 'no valid outfile'
+
+        stats = self._stats
+        if stats is None:
+            return self._save()
+        before = stats.as_dict()
+        start = perf_counter()
+        try:
+            return self._save()
+        finally:
+            stats.timers['save'] += perf_counter() - start
+            self._report_stats('save', before)
+
+    def _split_by_source(self):
+        """Return `[(input_file, text)]`, the annotations that were read
+        from each input file, in their current order. Annotations from
+        elsewhere (e.g. added since loading) go to the last file."""
+        input_files = self._input_files
+        if len(input_files) == 1:
+            return [(input_files[0], str(self))]
+        anns_by_file = dict((input_file, []) for input_file in input_files)
+        rest = anns_by_file[input_files[-1]]
+        for ann in self:
+            anns_by_file.get(ann.source_id, rest).append(ann)
+        return [(input_file, _anns_to_str(anns_by_file[input_file]))
+                for input_file in input_files]
 
+    def _save(self):
         # We are hitting the disk a lot more than we should here, what we
         # should have is a modification flag in the object but we can't
         # due to how we change the annotations.
 
-        out_str = str(self)
-        with open_textfile(self._input_files[0], 'r') as old_ann_file:
-            old_str = old_ann_file.read()
+        outputs = []
+        for input_file, out_str in self._split_by_source():
+            with open_textfile(input_file, 'r') as old_ann_file:
+                old_str = old_ann_file.read()
+            outputs.append((input_file, out_str, out_str != old_str))
 
         # Was it changed?
-        if out_str == old_str:
+        if not any(changed for _, _, changed in outputs):
             # Then just return
             return
 
@@ -1220,54 +1807,492 @@ class Annotations(object):
                     self.lock_dir, str(hash(self._input_files[0].replace('/', '_'))) + '.lock'
             ))
         with lock_file:
-            #from tempfile import NamedTemporaryFile
-            from tempfile import mkstemp
+            from tempfile import mkdtemp
             # TODO: XXX: Is copyfile really atomic?
-            from shutil import copyfile
-            # XXX: NamedTemporaryFile only supports encoding for Python 3
-            #       so we hack around it.
-            # with NamedTemporaryFile('w', suffix='.ann') as tmp_file:
-            # Grab the filename, but discard the handle
-            tmp_fh, tmp_fname = mkstemp(suffix='.ann')
-            os_close(tmp_fh)
+            from shutil import copyfile, rmtree
+            # The files are written under the same name into a temporary
+            # directory, so that they can be read back in together
+            tmp_dir = mkdtemp()
+            tmp_doc = path_join(tmp_dir, 'doc')
+            tmp_fnames = [tmp_doc + splitext(input_file)[1]
+                          for input_file, _, _ in outputs]
             try:
-                with open_textfile(tmp_fname, 'w') as tmp_file:
-                    # XXX: Temporary hack to make sure we don't write corrupted
-                    #       files, but the client will already have the version
-                    #       at this stage leading to potential problems upon
-                    #       the next change to the file.
-                    tmp_file.write(out_str)
-                    tmp_file.flush()
-
-                    try:
-                        with Annotations(tmp_file.name) as ann:
-                            # Move the temporary file onto the old file
-                            copyfile(tmp_file.name, self._input_files[0])
-                            # As a matter of convention we adjust the modified
-                            # time of the data dir when we write to it. This
-                            # helps us to make back-ups
-                            time()
-                            # XXX: Disabled for now!
-                            #utime(DATA_DIR, (now, now))
-                    except Exception as e:
-                        self.messages.error(
-                            'ERROR writing changes: generated annotations cannot be read back in!\n(This is almost certainly a system error, please contact the developers.)\n%s' %
-                            e, -1)
-                        raise
+                stats = self._stats
+                for tmp_fname, (_, out_str, changed) in zip(
+                        tmp_fnames, outputs):
+                    # XXX: Temporary hack to make sure we don't write
+                    #       corrupted files, but the client will already have
+                    #       the version at this stage leading to potential
+                    #       problems upon the next change to the file.
+                    with open_textfile(tmp_fname, 'w') as tmp_file:
+                        tmp_file.write(out_str)
+                    if stats is not None and changed:
+                        stats.count(
+                            'bytes_written', len(out_str.encode('utf8')))
+
+                if stats is not None:
+                    start = perf_counter()
+                try:
+                    Annotations(tmp_doc, read_only=True, stats=False)
+                    # Move the temporary files onto the old files
+                    for tmp_fname, (input_file, _, changed) in zip(
+                            tmp_fnames, outputs):
+                        if changed:
+                            copyfile(tmp_fname, input_file)
+                    # As a matter of convention we adjust the modified
+                    # time of the data dir when we write to it. This
+                    # helps us to make back-ups
+                    time()
+                    # XXX: Disabled for now!
+                    #utime(DATA_DIR, (now, now))
+                    if stats is not None:
+                        stats.timers['save_validate'] += \
+                            perf_counter() - start
+                except Exception as e:
+                    self._error(
+                        'save-unreadable',
+                        'ERROR writing changes: generated annotations cannot be read back in!\n(This is almost certainly a system error, please contact the developers.)\n%s',
+                        e, timeout=-1)
+                    raise
             finally:
                 try:
-                    from os import remove
-                    remove(tmp_fname)
+                    rmtree(tmp_dir)
                 except Exception as e:
-                    self.messages.error(
-                        "Error removing temporary file '%s'" %
-                        tmp_fname)
+                    self._error(
+                        'save-cleanup',
+                        "Error removing temporary directory '%s'", tmp_dir)
 
     def __in__(self, other):
         # XXX: You should do this one!
         pass
 
 
+class Change(object):
+    """A single entry of the document journal.
+
+    `kind` is one of `ADDED`, `DELETED` or `MODIFIED`, `line` the line of
+    the affected annotation (before deletion, after addition), `ann` the
+    annotation added, deleted or replacing `old_ann`, and `version` the
+    document version right after the change.
+
+    `TEXT` changes are edits of the document text: `line` is then the
+    offset of the edit, and `ann` the text replacing `old_ann` there.
+    """
+    __slots__ = ('version', 'kind', 'line', 'ann', 'old_ann')
+
+    ADDED = 'added'
+    DELETED = 'deleted'
+    MODIFIED = 'modified'
+    TEXT = 'text'
+
+    def __init__(self, version, kind, line, ann, old_ann=None):
+        self.version = version
+        self.kind = kind
+        self.line = line
+        self.ann = ann
+        self.old_ann = old_ann
+
+    def inverse(self):
+        if self.kind == Change.ADDED:
+            return Change(None, Change.DELETED, self.line, self.ann)
+        elif self.kind == Change.DELETED:
+            return Change(None, Change.ADDED, self.line, self.ann)
+        else:
+            return Change(None, self.kind, self.line, self.old_ann, self.ann)
+
+    def __repr__(self):
+        return u'Change(%s, %s, %d, %s)' % (
+            self.version, self.kind, self.line, str(self.ann).rstrip('\n'))
+
+
+class Journal(object):
+    """Log of changes to an `Annotations` object, grouped into undoable
+    operations.
+
+    Only references to annotations are kept; as annotations are replaced
+    rather than modified, these are enough to restore any version.
+    """
+
+    def __init__(self, limit=None):
+        if limit is None:
+            limit = JOURNAL_LIMIT
+        self.version = 0
+        self.listeners = []
+        self._changes = deque(maxlen=limit)
+        self._undo = deque(maxlen=limit)
+        self._redo = []
+        self._group = None
+        self._depth = 0
+        self._replaying = False
+
+    def begin(self):
+        if self._depth == 0:
+            self._group = []
+        self._depth += 1
+
+    def end(self):
+        self._depth -= 1
+        if self._depth:
+            return
+        group, self._group = self._group, None
+        replaying, self._replaying = self._replaying, False
+        if not group:
+            return
+        if not replaying:
+            self._undo.append(group)
+            self._redo = []
+        for change in group:
+            for listener in self.listeners:
+                listener(change)
+
+    def discard(self):
+        """Forget the changes of the outermost open group, which the caller
+        has already reverted."""
+        group, self._group = self._group, None
+        self._depth = 0
+        self._replaying = False
+        self.version -= len(group)
+        while self._changes and self._changes[-1].version > self.version:
+            self._changes.pop()
+
+    def record(self, kind, line, ann, old_ann=None):
+        self.begin()
+        self.version += 1
+        change = Change(self.version, kind, line, ann, old_ann)
+        self._changes.append(change)
+        self._group.append(change)
+        self.end()
+
+    def _replay(self, changes, apply):
+        # The enclosing group is not itself undoable
+        self.begin()
+        self._replaying = True
+        try:
+            for change in changes:
+                apply(change)
+        finally:
+            self.end()
+
+    def undo(self, apply):
+        if not self._undo:
+            return False
+        group = self._undo.pop()
+        self._replay([change.inverse() for change in reversed(group)], apply)
+        self._redo.append(group)
+        return True
+
+    def redo(self, apply):
+        if not self._redo:
+            return False
+        group = self._redo.pop()
+        self._replay(group, apply)
+        self._undo.append(group)
+        return True
+
+    def since(self, version):
+        if version >= self.version:
+            return []
+        if not self._changes or self._changes[0].version > version + 1:
+            return None
+        skip = version + 1 - self._changes[0].version
+        return list(islice(self._changes, skip, None))
+
+
+class ReadWriteLock(object):
+    """Reentrant lock allowing many readers or a single writer.
+
+    Waiting writers take precedence over new readers, so that a stream of
+    readers can not starve them. The writer may also take the read lock, but
+    a reader can not upgrade to the write lock (it raises `RuntimeError`,
+    instead of deadlocking).
+
+    `with lock.read:` and `with lock.write:` are shorthands for the
+    acquire/release pairs.
+    """
+
+    def __init__(self):
+        # The mutex alone is taken when there is no one to wait for
+        self._mutex = Lock()
+        self._cond = Condition(self._mutex)
+        # Read lock count by thread
+        self._readers = {}
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_readers = 0
+        self._waiting_writers = 0
+        self.read = _LockSide(self.acquire_read, self.release_read)
+        self.write = _LockSide(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        me = get_ident()
+        with self._mutex:
+            readers = self._readers
+            if me in readers:
+                readers[me] += 1
+                return
+            if self._writer != me:
+                self._waiting_readers += 1
+                try:
+                    while self._writer is not None or self._waiting_writers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_readers -= 1
+            readers[me] = 1
+
+    def release_read(self):
+        me = get_ident()
+        with self._mutex:
+            readers = self._readers
+            count = readers[me] - 1
+            if count:
+                readers[me] = count
+            else:
+                del readers[me]
+                if not readers and self._waiting_writers:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        me = get_ident()
+        with self._mutex:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            if me in self._readers:
+                raise RuntimeError('Cannot upgrade a read lock to a write lock')
+            if self._writer is not None or self._readers:
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        with self._mutex:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                if self._waiting_readers or self._waiting_writers:
+                    self._cond.notify_all()
+
+
+class _LockSide(object):
+    __slots__ = ('_acquire', '_release')
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, type, value, traceback):
+        self._release()
+
+
+class _NullLock(object):
+    """Stands in for `ReadWriteLock` when thread safety is not needed."""
+
+    def __init__(self):
+        self.read = self.write = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    def acquire_read(self):
+        pass
+
+    acquire_write = release_read = release_write = acquire_read
+
+
+NULL_LOCK = _NullLock()
+
+
+class Stats(object):
+    """Timers (seconds, by phase) and counters collected while loading and
+    saving documents.
+
+    Phases are "read_text", "parse" (which includes "verify_textbounds"),
+    "sanity", and "save" (which includes "save_validate").
+    """
+
+    COUNTERS = ('lines_parsed', 'failed_lines', 'bytes_read', 'bytes_written',
+                'cache_hits')
+
+    def __init__(self):
+        self.timers = defaultdict(float)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        # The global stats are added to from any thread
+        self._lock = Lock()
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def add(self, stats):
+        """Add `stats`, a dict as returned by `as_dict`."""
+        with self._lock:
+            for phase, seconds in stats['timers'].items():
+                self.timers[phase] += seconds
+            for counter, n in stats['counters'].items():
+                self.count(counter, n)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'timers': dict(self.timers),
+                'counters': dict(self.counters),
+            }
+
+
+GLOBAL_STATS = Stats()
+_stats_enabled = False
+_stats_hook = None
+
+
+def enable_stats(hook=None):
+    """Collect stats for documents created from now on (unless created with
+    `stats=False`). If given, `hook(doc, event, stats)` is called at the end
+    of each load and save, `event` being "load" or "save", and `stats` the
+    dict of the timers and counters of that operation alone."""
+    global _stats_enabled, _stats_hook
+    _stats_enabled = True
+    _stats_hook = hook
+
+
+def disable_stats():
+    global _stats_enabled, _stats_hook
+    _stats_enabled = False
+    _stats_hook = None
+
+
+def get_global_stats():
+    """Return the stats summed over all documents, as a dict."""
+    return GLOBAL_STATS.as_dict()
+
+
+def reset_global_stats():
+    global GLOBAL_STATS
+    GLOBAL_STATS = Stats()
+
+
+class _BatchState(object):
+    """What `Annotations.batch()` needs to finish or undo a batch."""
+
+    def __init__(self, anns):
+        self.max_id_num_by_prefix = anns._max_id_num_by_prefix.copy()
+        self.ann_mtime = getattr(anns, 'ann_mtime', None)
+        # Lines from this one on are not yet in `_line_by_ann`
+        self.unindexed_from = len(anns._lines)
+        self.new_ids = []
+        # The changes made so far, which a rollback undoes
+        self.changes = []
+
+
+class SpanIndex(object):
+    """The spans of text-bound annotations, sorted by start.
+
+    `max_ends[i]` is the largest end of the spans up to `i`, so the spans
+    reaching an offset can be found by bisection, skipping those that end
+    before it. Spans refer to their annotation by id, so that replacing
+    an annotation does not invalidate the index.
+    """
+
+    def __init__(self, anns=(), version=None):
+        self.version = version
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.max_ends = []
+        self.set_from(0, sorted(
+            (start, end, ann.id) for ann in anns for start, end in ann.spans))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def first_reaching(self, offset):
+        """Return the index of the first span that might end at `offset` or
+        later; all spans before it end before `offset`."""
+        return bisect_left(self.max_ends, offset)
+
+    def overlapping(self, start, end):
+        """Return the ids of the annotations with spans overlapping `start`
+        to `end` (or empty spans in it), once each, in order of the spans."""
+        ids = {}
+        first = self.first_reaching(start)
+        for i in range(first, bisect_left(self.starts, end, first)):
+            if self.ends[i] > start or self.starts[i] == start:
+                ids[self.ids[i]] = None
+        return list(ids)
+
+    def set_from(self, index, entries):
+        """Replace the spans from `index` on by the sorted `(start, end,
+        id)` entries."""
+        del self.starts[index:], self.ends[index:], self.ids[index:]
+        del self.max_ends[index:]
+        for start, end, id in entries:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.ids.append(id)
+        initial = self.max_ends[-1] if self.max_ends else 0
+        self.max_ends.extend(
+            accumulate(chain([initial], self.ends[index:]), max))
+        del self.max_ends[index]
+
+
+class AnnotationsSnapshot(object):
+    """Immutable view of an `Annotations` (or `TextAnnotations`) object at
+    a given version, as returned by `Annotations.snapshot`.
+
+    Supports the read-only part of the `Annotations` interface.
+    """
+
+    # Immutable, so never needs locking
+    _lock = NULL_LOCK
+    _write_seq = 0
+    # Built on first use (see `Annotations._get_span_index`)
+    _span_index = None
+
+    def __init__(self, document, lines, ann_by_id, text, version):
+        self._document = document
+        self._lines = lines
+        self._ann_by_id = ann_by_id
+        self._document_text = text
+        self.version = version
+
+    def get_document_text(self):
+        if self._document_text is None:
+            raise AttributeError('Snapshot of annotations without text')
+        return self._document_text
+
+    def snapshot(self):
+        return self
+
+    def __iter__(self):
+        return iter(self._lines)
+
+    get_document = Annotations.get_document
+    get_events = Annotations.get_events
+    get_attributes = Annotations.get_attributes
+    get_equivs = Annotations.get_equivs
+    get_textbounds = Annotations.get_textbounds
+    get_relations = Annotations.get_relations
+    get_normalizations = Annotations.get_normalizations
+    get_entities = Annotations.get_entities
+    get_oneline_comments = Annotations.get_oneline_comments
+    get_statuses = Annotations.get_statuses
+    get_triggers = Annotations.get_triggers
+    get_ann_by_id = Annotations.get_ann_by_id
+    _get_span_index = Annotations._get_span_index
+    __str__ = Annotations.__str__
+    __getitem__ = Annotations.__getitem__
+    __len__ = Annotations.__len__
+
+
 class TextAnnotations(Annotations):
     """Text-bound annotation storage.
 
@@ -1276,10 +2301,13 @@ class TextAnnotations(Annotations):
     annotations against the text.
     """
 
-    def __init__(self, document=None, text=None, read_only=False, lock_dir=None, source=None):
-        self._init_messager()
+    def __init__(self, document=None, text=None, read_only=False, lock_dir=None, source=None,
+                 thread_safe=False, stats=None, messages=None):
+        self._init_messager(messages)
+        self._init_stats(stats)
 
         # First read the text or the Annotations can't verify the annotations
+        self._text_file_path = None
         if document:
             if document.endswith('.txt'):
                 textfile_path = document
@@ -1291,13 +2319,22 @@ class TextAnnotations(Annotations):
                 else:
                     textfile_path = document[:len(document) - len(file_ext)]
 
+            self._text_file_path = textfile_path + '.' + TEXT_FILE_SUFFIX
             if text is None:
+                if self._stats is not None:
+                    start = perf_counter()
                 self._document_text = self._read_document_text(textfile_path)
+                if self._stats is not None:
+                    self._stats.timers['read_text'] += perf_counter() - start
+                    self._stats.count(
+                        'bytes_read',
+                        getsize(textfile_path + '.' + TEXT_FILE_SUFFIX))
 
         if text is not None:
             self._document_text = text
 
-        Annotations.__init__(self, document=document, read_only=read_only, lock_dir=lock_dir, source=source)
+        Annotations.__init__(self, document=document, read_only=read_only, lock_dir=lock_dir, source=source,
+                             thread_safe=thread_safe, stats=stats, messages=messages)
 
     def _parse_textbound_annotation(
             self, id, data, data_tail, input_file_path):
@@ -1307,22 +2344,33 @@ class TextAnnotations(Annotations):
         seen_spans = []
         for start, end in spans:
             if start > end:
-                self.messages.error('Text-bound annotation start > end.')
+                self._error(
+                    'textbound-start-after-end',
+                    'Text-bound annotation start > end.',
+                    line_num=self.ann_line_num + 1, ann_id=id)
                 raise IdedAnnotationLineSyntaxError(
                     id, self.ann_line, self.ann_line_num + 1, input_file_path)
             if start < 0:
-                self.messages.error('Text-bound annotation start < 0.')
+                self._error(
+                    'textbound-negative-start',
+                    'Text-bound annotation start < 0.',
+                    line_num=self.ann_line_num + 1, ann_id=id)
                 raise IdedAnnotationLineSyntaxError(
                     id, self.ann_line, self.ann_line_num + 1, input_file_path)
             if end > len(self._document_text):
-                self.messages.error(
-                    'Text-bound annotation offset exceeds text length.')
+                self._error(
+                    'textbound-past-text',
+                    'Text-bound annotation offset exceeds text length.',
+                    line_num=self.ann_line_num + 1, ann_id=id)
                 raise IdedAnnotationLineSyntaxError(
                     id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
             for ostart, oend in seen_spans:
                 if end >= ostart and start < oend:
-                    self.messages.error('Text-bound annotation spans overlap')
+                    self._error(
+                        'textbound-spans-overlap',
+                        'Text-bound annotation spans overlap',
+                        line_num=self.ann_line_num + 1, ann_id=id)
                     raise IdedAnnotationLineSyntaxError(
                         id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
@@ -1336,20 +2384,27 @@ class TextAnnotations(Annotations):
         # corresponding to the catenation of the start:end spans.
         # If the tail is empty, force a fill with the corresponding text.
         if data_tail.strip() == '' and spanlen > 0:
-            self.messages.error(
-                u"Text-bound annotation missing text (expected format 'ID\\tTYPE START END\\tTEXT'). Filling from reference text. NOTE: This changes annotations on disk unless read-only.")
+            self._error(
+                'textbound-missing-text',
+                u"Text-bound annotation missing text (expected format 'ID\\tTYPE START END\\tTEXT'). Filling from reference text. NOTE: This changes annotations on disk unless read-only.",
+                line_num=self.ann_line_num + 1, ann_id=id)
             text = "".join([self._document_text[start:end]
                             for start, end in spans])
 
         elif data_tail[0] != '\t':
-            self.messages.error(
-                'Text-bound annotation missing tab before text (expected format "ID\\tTYPE START END\\tTEXT").')
+            self._error(
+                'textbound-missing-tab',
+                'Text-bound annotation missing tab before text (expected format "ID\\tTYPE START END\\tTEXT").',
+                line_num=self.ann_line_num + 1, ann_id=id)
             raise IdedAnnotationLineSyntaxError(
                 id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
         elif spanlen > len(data_tail) - 1:  # -1 for tab
-            self.messages.error(
-                'Text-bound annotation text "%s" shorter than marked span(s) %s' % (data_tail[1:], str(spans)))
+            self._error(
+                'textbound-text-too-short',
+                'Text-bound annotation text "%s" shorter than marked span(s) %s',
+                data_tail[1:], spans,
+                line_num=self.ann_line_num + 1, ann_id=id)
             raise IdedAnnotationLineSyntaxError(
                 id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
@@ -1366,24 +2421,31 @@ class TextAnnotations(Annotations):
                 # discont that catenated spans without DISCONT_SEP
                 oldstylereftext = ''.join(spantexts)
                 if text[:len(oldstylereftext)] == oldstylereftext:
-                    self.messages.warning(
-                        u'NOTE: replacing old-style (pre-1.3) discontinuous annotation text span with new-style one, i.e. adding space to "%s" in .ann' % text[:len(oldstylereftext)], -1)
+                    self._warning(
+                        'textbound-old-style-discont',
+                        u'NOTE: replacing old-style (pre-1.3) discontinuous annotation text span with new-style one, i.e. adding space to "%s" in .ann',
+                        text[:len(oldstylereftext)],
+                        line_num=self.ann_line_num + 1, ann_id=id,
+                        timeout=-1)
                     text = reftext
                     data_tail = ''
                 else:
                     # unanticipated mismatch
-                    self.messages.error(
+                    self._error(
+                        'textbound-text-mismatch',
                         (u'Text-bound annotation text "%s" does not '
-                         u'match marked span(s) %s text "%s" in document') %
-                        (text, str(spans), reftext.replace(
-                            '\n', '\\n')))
+                         u'match marked span(s) %s text "%s" in document'),
+                        text, spans, reftext.replace('\n', '\\n'),
+                        line_num=self.ann_line_num + 1, ann_id=id)
                     raise IdedAnnotationLineSyntaxError(
                         id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
             if data_tail != '' and not data_tail[0].isspace():
-                self.messages.error(
-                    u'Text-bound annotation text "%s" not separated from rest of line ("%s") by space!' %
-                    (text, data_tail))
+                self._error(
+                    'textbound-text-unseparated',
+                    u'Text-bound annotation text "%s" not separated from rest of line ("%s") by space!',
+                    text, data_tail,
+                    line_num=self.ann_line_num + 1, ann_id=id)
                 raise IdedAnnotationLineSyntaxError(
                     id, self.ann_line, self.ann_line_num + 1, input_file_path)
 
@@ -1393,6 +2455,139 @@ class TextAnnotations(Annotations):
     def get_document_text(self):
         return self._document_text
 
+    def apply_edits(self, edits):
+        """Edit the text, and move the text-bound annotations along.
+
+        `edits` is a list of `(pos, delete_len, insert_text)`, each
+        replacing `delete_len` characters at `pos` by `insert_text`. The
+        positions are all in the text before the call, and edits may not
+        overlap.
+
+        Spans after an edit are shifted. Text inserted at the boundary of a
+        span is left out of it, but text replacing a part of a span becomes
+        part of it; spans deleted entirely are dropped, unless nothing would
+        be left of the annotation. The annotations with a span that an edit
+        overlaps or borders get their text updated, and are returned.
+
+        Only the annotations reaching the first edit are looked at, found
+        through a `SpanIndex`. All the edits make a single undo step.
+        """
+        if self._read_only:
+            raise AnnotationsIsReadOnlyError(self.get_document())
+
+        text = self._document_text
+        edits = sorted(edits, key=lambda edit: edit[0])
+        # Each edit as `(start, end, new_start, new_end)`
+        regions = []
+        shift = 0
+        prev_pos = prev_end = -1
+        for pos, delete_len, insert_text in edits:
+            if (pos <= prev_pos or pos < prev_end or delete_len < 0
+                    or pos < 0 or pos + delete_len > len(text)):
+                raise AnnotationError(
+                    'Invalid or overlapping text edit at %d' % pos)
+            regions.append((pos, pos + delete_len, pos + shift,
+                            pos + shift + len(insert_text)))
+            shift += len(insert_text) - delete_len
+            prev_pos, prev_end = pos, pos + delete_len
+        if not regions:
+            return []
+        region_starts = [region[0] for region in regions]
+
+        def edited(offset, is_end):
+            ix = bisect_right(region_starts, offset) - 1
+            if ix < 0:
+                return offset
+            start, end, new_start, new_end = regions[ix]
+            if offset > end or (offset == end and end > start):
+                return offset + new_end - end
+            if offset == start:
+                # Insertions belong to neither neighbouring span
+                if end == start and not is_end:
+                    return new_end
+                return new_start
+            # Inside a replaced stretch; stretch the span over it
+            return new_end if is_end else new_start
+
+        def touches(span_start, span_end):
+            ix = bisect_right(region_starts, span_end) - 1
+            return ix >= 0 and regions[ix][1] >= span_start
+
+        self._begin_write()
+        try:
+            index = self._get_span_index()
+            first_pos = regions[0][0]
+            first = index.first_reaching(first_pos)
+            affected = dict.fromkeys(
+                index.ids[ix] for ix in range(first, len(index))
+                if index.ends[ix] >= first_pos)
+
+            touched = []
+            replacements = []
+            entries = [
+                (index.starts[ix], index.ends[ix], index.ids[ix])
+                for ix in range(first, len(index))
+                if index.ends[ix] < first_pos]
+            for id in affected:
+                ann = self._ann_by_id[id]
+                new_spans = []
+                is_touched = False
+                for start, end in ann.spans:
+                    new_start = edited(start, False)
+                    new_end = max(new_start, edited(end, True))
+                    if end >= first_pos and touches(start, end):
+                        is_touched = True
+                    if new_start < new_end:
+                        new_spans.append((new_start, new_end))
+                        if end >= first_pos:
+                            entries.append((new_start, new_end, id))
+                if not new_spans:
+                    new_spans = [(new_start, new_start)]
+                    entries.append((new_start, new_start, id))
+                if not is_touched and new_spans == [
+                        tuple(span) for span in ann.spans]:
+                    continue
+                new_ann = copy(ann)
+                new_ann.spans = new_spans
+                replacements.append((ann, new_ann))
+                if is_touched:
+                    touched.append(new_ann)
+
+            # Apply the edits back to front, so each one's position still
+            # holds when it is applied (and when undone, front to back)
+            pieces = []
+            pos = len(text)
+            for (start, end, _, _), (_, _, insert_text) in zip(
+                    reversed(regions), reversed(edits)):
+                pieces.append(text[end:pos])
+                pieces.append(insert_text)
+                self._record(Change.TEXT, start, insert_text, text[start:end])
+                pos = start
+            pieces.append(text[:pos])
+            self._document_text = ''.join(reversed(pieces))
+
+            for new_ann in touched:
+                if isinstance(new_ann, TextBoundAnnotationWithText):
+                    new_ann.text = DISCONT_SEP.join(
+                        self._document_text[start:end]
+                        for start, end in new_ann.spans)
+            for ann, new_ann in replacements:
+                self._replace_annotation(ann, new_ann)
+
+            entries.sort()
+            index.set_from(first, entries)
+            index.version = self.version
+            self._span_index = index
+        finally:
+            self._end_write()
+        return touched
+
+    def _splice_text(self, pos, old_text, new_text):
+        # Journalled text edit, that leaves the annotations alone
+        text = self._document_text
+        self._document_text = text[:pos] + new_text + text[pos + len(old_text):]
+        self._record(Change.TEXT, pos, new_text, old_text)
+
     def _read_document_text(self, document):
         # TODO: this is too naive; document may be e.g. "PMID.a1",
         # in which case the reasonable text file name guess is
@@ -1402,7 +2597,8 @@ class TextAnnotations(Annotations):
             with open_textfile(textfn, 'r') as f:
                 return f.read()
         except IOError:
-            self.messages.error('Error reading document text from %s' % textfn)
+            self._error('text-unreadable',
+                        'Error reading document text from %s', textfn)
         raise AnnotationTextFileNotFoundError(document)
 
 
@@ -1654,13 +2850,17 @@ class NormalizationAnnotation(IdedAnnotation):
         self.reftext = tail.lstrip('\t').rstrip('\n')
 
     def __str__(self):
-        return u'%s\t%s %s %s:%s\t%s' % (
+        # Parsed tails start with the tab, given ones might not
+        tail = self.tail
+        if tail.strip() and tail[0] != '\t':
+            tail = '\t' + tail
+        return u'%s\t%s %s %s:%s%s' % (
             self.id,
             self.type,
             self.target,
             self.refdb,
             self.refid,
-            self.tail,
+            tail,
         )
 
     def get_deps(self):
@@ -1903,6 +3103,60 @@ class BinaryRelationAnnotation(IdedAnnotation):
         return soft_deps, hard_deps
 
 
+def _anns_to_str(anns):
+    s = u'\n'.join(str(ann).rstrip(u'\r\n') for ann in anns)
+    if not s:
+        return u''
+    else:
+        return s if s[-1] == u'\n' else s + u'\n'
+
+
+def _split_lines(text):
+    # Like `text.splitlines(True)`, but only splitting on newlines (as
+    # `readlines` does), not on other line boundaries such as U+2028
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+# Directory listings, least recently used first: the `stat` they are valid
+# for, and the known annotation file suffixes of each document in the
+# directory. Only the last few directories are kept.
+ANN_FILE_SUFFIXES_CACHE_SIZE = 32
+_ann_file_suffixes_cache = OrderedDict()
+_ann_file_suffixes_lock = Lock()
+
+
+def _ann_file_suffixes(directory):
+    try:
+        st = stat(directory)
+    except OSError:
+        return {}
+    # The mtime alone can miss a change made within its resolution, or a
+    # directory replaced by another one
+    key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    with _ann_file_suffixes_lock:
+        cached = _ann_file_suffixes_cache.get(directory)
+        if cached is not None and cached[0] == key:
+            _ann_file_suffixes_cache.move_to_end(directory)
+            return cached[1]
+    suffs_by_document = defaultdict(set)
+    with scandir(directory) as entries:
+        for entry in entries:
+            document, dot, suff = entry.name.rpartition('.')
+            if dot and suff in KNOWN_FILE_SUFF and entry.is_file():
+                suffs_by_document[document].add(suff)
+    with _ann_file_suffixes_lock:
+        _ann_file_suffixes_cache[directory] = (key, suffs_by_document)
+        _ann_file_suffixes_cache.move_to_end(directory)
+        while len(_ann_file_suffixes_cache) > ANN_FILE_SUFFIXES_CACHE_SIZE:
+            _ann_file_suffixes_cache.popitem(last=False)
+    return suffs_by_document
+
+
 def _writable(sugg_path):
     if exists(sugg_path):
         # check the file itself for writability
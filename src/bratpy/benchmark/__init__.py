@@ -0,0 +1,2 @@
+from .corpus import generate_corpus, generate_document
+from .suite import BENCHMARKS, run_suite, compare
@@ -0,0 +1,67 @@
+'''
+Run the benchmark suite over a synthetic corpus, and output JSON results.
+
+    python -m bratpy.benchmark [-o results.json] [--compare old.json]
+'''
+
+from argparse import ArgumentParser
+from json import dump, load
+from sys import stdout, stderr
+from tempfile import TemporaryDirectory
+
+from .corpus import generate_corpus
+from .suite import BENCHMARKS, run_suite, compare
+
+
+def argparser():
+    ap = ArgumentParser(description="Time bratpy's hot paths")
+    ap.add_argument('-o', '--output', help="JSON output file (default stdout)")
+    ap.add_argument('--compare', metavar='JSON',
+                    help="Print time ratios against an earlier run to stderr")
+    ap.add_argument('-r', '--repeat', type=int, default=3)
+    ap.add_argument('-b', '--benchmark', action='append', dest='names',
+                    choices=list(BENCHMARKS),
+                    help="Run only this benchmark (repeatable)")
+    ap.add_argument('--corpus-dir',
+                    help="Keep the generated corpus here (default temporary)")
+    ap.add_argument('--documents', type=int, default=20)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--size', type=int, default=10000,
+                    help="Approximate characters per document")
+    ap.add_argument('--density', type=float, default=0.15)
+    ap.add_argument('--discontinuous', type=float, default=0.05)
+    ap.add_argument('--events', type=float, default=0.1)
+    ap.add_argument('--equivs', type=float, default=0.05)
+    ap.add_argument('--attributes', type=float, default=0.1)
+    ap.add_argument('--normalizations', type=float, default=0.1)
+    return ap
+
+
+def main(argv=None):
+    args = argparser().parse_args(argv)
+    corpus = {
+        name: getattr(args, name)
+        for name in ('documents', 'seed', 'size', 'density', 'discontinuous',
+                     'events', 'equivs', 'attributes', 'normalizations')
+    }
+
+    with TemporaryDirectory() as tmp_dir:
+        paths = generate_corpus(args.corpus_dir or tmp_dir, **corpus)
+        results = run_suite(paths, args.repeat, args.names, corpus)
+
+    if args.output:
+        with open(args.output, 'w') as w:
+            dump(results, w, indent=2)
+    else:
+        dump(results, stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as r:
+            old = load(r)
+        for name, ratio in compare(old, results).items():
+            print("%-40s %6.2fx" % (name, ratio), file=stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+'''
+Synthetic brat corpus generator.
+
+The generated annotations are well-formed (they load without errors or
+warnings), but carry no meaning.
+'''
+
+from itertools import islice
+from os import makedirs
+from os.path import join as path_join
+from random import Random
+
+
+ENTITY_TYPES = ('Protein', 'Gene', 'Cell', 'Chemical')
+EVENT_TYPES = ('Binding', 'Regulation', 'Expression')
+CONFIDENCES = ('High', 'Medium', 'Low')
+
+
+def _word(rng):
+    return ''.join(
+        rng.choice('abcdefghijklmnopqrstuvwxyz')
+        for _ in range(rng.randint(2, 10)))
+
+
+def generate_text(rng, size):
+    """Return text of about `size` characters, as paragraphs of sentences,
+    along with the list of its `(start, end, paragraph)` tokens."""
+    parts = []
+    tokens = []
+    pos = 0
+    paragraph = 0
+    while pos < size:
+        for _ in range(rng.randint(1, 6)):
+            words = [_word(rng) for _ in range(rng.randint(5, 25))]
+            words[0] = words[0].capitalize()
+            for word in words:
+                tokens.append((pos, pos + len(word), paragraph))
+                pos += len(word) + 1
+            # The full stop
+            pos += 1
+            parts.append(' '.join(words) + '.')
+            parts.append(' ')
+        parts[-1] = '\n'
+        paragraph += 1
+    return ''.join(parts), tokens
+
+
+def generate_document(size=10000, density=0.15, discontinuous=0.05,
+                      events=0.1, equivs=0.05, attributes=0.1,
+                      normalizations=0.1, seed=None):
+    """Return `(text, ann)` of a synthetic document.
+
+    `size` is the approximate text length in characters; `density` the
+    fraction of tokens that start a text-bound annotation. `discontinuous`
+    is the fraction of those with two spans, and `events` the fraction that
+    are event triggers. `equivs` is the fraction of entities that are in an
+    equiv group; `attributes` and `normalizations` are the fractions of
+    entities (and for attributes, events) that have one.
+    """
+    rng = Random(seed)
+    text, tokens = generate_text(rng, size)
+    lines = []
+
+    starts = sorted(rng.sample(
+        range(len(tokens) - 3), int(len(tokens) * density)))
+    entities = []
+    triggers = []
+    for t_num, token_ix in enumerate(starts, 1):
+        id = 'T%d' % t_num
+        start, end, paragraph = tokens[token_ix]
+        if rng.random() < discontinuous:
+            spans = [(start, end), tokens[token_ix + 2][:2]]
+        else:
+            # Multi-token spans stay within the paragraph (no newlines)
+            for next_start, next_end, next_paragraph in islice(
+                    tokens, token_ix + 1, token_ix + rng.randint(1, 3)):
+                if next_paragraph != paragraph:
+                    break
+                end = next_end
+            spans = [(start, end)]
+        if rng.random() < events:
+            type = rng.choice(EVENT_TYPES)
+            triggers.append((id, type))
+        else:
+            type = rng.choice(ENTITY_TYPES)
+            entities.append((id, type))
+        lines.append('%s\t%s %s\t%s\n' % (
+            id, type,
+            ';'.join('%d %d' % span for span in spans),
+            ' '.join(text[start:end] for start, end in spans)))
+
+    event_ids = []
+    if entities:
+        for e_num, (trigger_id, type) in enumerate(triggers, 1):
+            id = 'E%d' % e_num
+            args = ['Theme:%s' % rng.choice(entities)[0]]
+            if rng.random() < 0.3:
+                args.append('Cause:%s' % rng.choice(entities)[0])
+            lines.append('%s\t%s:%s %s\n' % (
+                id, type, trigger_id, ' '.join(args)))
+            event_ids.append(id)
+
+    # Triggers may only be referenced by events
+    for entity_ixs in _groups(rng, len(entities), equivs):
+        lines.append('*\tEquiv %s\n' % ' '.join(
+            entities[ix][0] for ix in entity_ixs))
+
+    targets = [id for id, _ in entities] + event_ids
+    for a_num, target in enumerate(
+            (id for id in targets if rng.random() < attributes), 1):
+        if a_num % 2:
+            lines.append('A%d\tNegation %s\n' % (a_num, target))
+        else:
+            lines.append('A%d\tConfidence %s %s\n' % (
+                a_num, target, rng.choice(CONFIDENCES)))
+
+    for n_num, (target, _) in enumerate(
+            (entity for entity in entities if rng.random() < normalizations),
+            1):
+        lines.append('N%d\tReference %s Wikipedia:%d\t%s\n' % (
+            n_num, target, rng.randint(1, 10**7), _word(rng)))
+
+    return text, ''.join(lines)
+
+
+def _groups(rng, count, fraction):
+    # Disjoint groups of 2-3 indices, covering about `fraction` of `count`
+    ixs = rng.sample(range(count), int(count * fraction))
+    while len(ixs) >= 2:
+        size = min(rng.randint(2, 3), len(ixs))
+        yield ixs[:size]
+        ixs = ixs[size:]
+
+
+def generate_corpus(directory, documents=10, seed=0, **params):
+    """Write `documents` synthetic documents (`.txt` and `.ann`) into
+    `directory`, and return their paths (without extension). `params` are
+    passed on to `generate_document`."""
+    makedirs(directory, exist_ok=True)
+    paths = []
+    for doc_num in range(documents):
+        text, ann = generate_document(seed=seed + doc_num, **params)
+        path = path_join(directory, 'doc%05d' % doc_num)
+        with open(path + '.txt', 'w', encoding='utf-8', newline='') as w:
+            w.write(text)
+        with open(path + '.ann', 'w', encoding='utf-8', newline='') as w:
+            w.write(ann)
+        paths.append(path)
+    return paths
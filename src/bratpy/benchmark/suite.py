@@ -0,0 +1,430 @@
+'''
+Timings of the hot paths of bratpy over a synthetic corpus.
+
+Each benchmark takes the list of document paths, and returns the seconds
+spent in the timed part of one run along with the number of operations it
+performed; setup (such as loading the documents to be changed) is not
+timed.
+'''
+
+from importlib import import_module
+from io import StringIO
+from os import environ
+from os.path import basename, dirname, join as path_join
+from pkgutil import iter_modules
+from subprocess import run, PIPE
+import sys
+from platform import platform, python_implementation, python_version
+from shutil import copyfile
+from statistics import mean, median
+from tempfile import TemporaryDirectory
+from time import time
+from timeit import default_timer
+
+from ..annotation import (
+        TextAnnotations, TextBoundAnnotationWithText, IdedAnnotation,
+        AttributeAnnotation, NormalizationAnnotation)
+from ..conf import ConfCache
+from ..diff_and_mark import AnnotationDiff
+from ..export import export_corpus
+from ..json import get_doc_json, get_doc_json_delta, get_doc_summary
+from ..splitters import StandoffCache
+from .. import webanno_tsv
+from .corpus import ENTITY_TYPES, EVENT_TYPES
+
+
+class Timer(object):
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.elapsed = default_timer() - self.start
+
+
+def _load(paths, read_only=True):
+    # Changed documents are never saved, unless asked to
+    return [TextAnnotations(path, read_only=read_only) for path in paths]
+
+
+def bench_load(paths):
+    with Timer() as timer:
+        _load(paths)
+    return timer.elapsed, len(paths)
+
+
+def bench_sanity(paths):
+    docs = _load(paths)
+    with Timer() as timer:
+        for doc in docs:
+            doc._sanity()
+    return timer.elapsed, len(docs)
+
+
+def bench_get_entities(paths):
+    docs = _load(paths)
+    with Timer() as timer:
+        for doc in docs:
+            list(doc.get_entities())
+    return timer.elapsed, len(docs)
+
+
+def bench_del_annotation(paths):
+    # Delete the leaf annotations, and the entities nothing refers to
+    docs = _load(paths, read_only=False)
+    victims = []
+    for doc in docs:
+        referenced = set()
+        for ann in doc:
+            for deps in ann.get_deps():
+                referenced |= deps
+        victims.append([
+            ann for ann in doc
+            if isinstance(ann, IdedAnnotation) and (
+                isinstance(ann, (AttributeAnnotation, NormalizationAnnotation))
+                or ann.id not in referenced)
+        ])
+    with Timer() as timer:
+        for doc, anns in zip(docs, victims):
+            for ann in anns:
+                doc.del_annotation(ann)
+    return timer.elapsed, sum(len(anns) for anns in victims)
+
+
+def _locking_bench(thread_safe, rounds=20):
+    def bench(paths):
+        # Lookups and iterations, alone and alternating with changes as an
+        # editor's would; the same with `thread_safe` times the locking
+        docs = [TextAnnotations(path, read_only=False, thread_safe=thread_safe)
+                for path in paths]
+        ops = 0
+        with Timer() as timer:
+            for doc in docs:
+                ids = [ann.id for ann in doc if isinstance(ann, IdedAnnotation)]
+                for id in ids:
+                    doc.get_ann_by_id(id)
+                for _ in range(rounds):
+                    for ann in doc:
+                        pass
+                anns = list(doc.get_entities())[:rounds]
+                for ann in anns:
+                    for _ in doc:
+                        pass
+                    doc.modify_annotation(ann, type='Changed')
+                ops += len(ids) + rounds + len(anns)
+        return timer.elapsed, ops
+    return bench
+
+
+def bench_get_new_id(paths, count=100):
+    docs = _load(paths)
+    with Timer() as timer:
+        for doc in docs:
+            for _ in range(count):
+                doc.get_new_id('T')
+    return timer.elapsed, len(docs) * count
+
+
+def bench_save(paths):
+    with TemporaryDirectory() as tmp_dir:
+        docs = []
+        for path in paths:
+            copy_path = '%s/%s' % (tmp_dir, basename(path))
+            copyfile(path + '.txt', copy_path + '.txt')
+            copyfile(path + '.ann', copy_path + '.ann')
+            doc = TextAnnotations(copy_path)
+            # Make sure there is something to write
+            TextBoundAnnotationWithText(
+                [[0, 1]], doc.get_new_id('T'), 'Added', doc)
+            docs.append(doc)
+        with Timer() as timer:
+            for doc in docs:
+                doc.save()
+    return timer.elapsed, len(docs)
+
+
+def bench_diff(paths):
+    pairs = []
+    for doc, changed in zip(_load(paths), _load(paths, read_only=False)):
+        # Retype every tenth entity, so there is something to mark
+        for ann in list(changed.get_entities())[::10]:
+            changed.modify_annotation(ann, type='Changed')
+        pairs.append((doc, changed))
+    with Timer() as timer:
+        for first, second in pairs:
+            AnnotationDiff(first, second).diff()
+    return timer.elapsed, len(pairs)
+
+
+WEBANNO_HEADER = [
+    "#FORMAT=WebAnno TSV 3.3\n",
+    "#T_SP=webanno.custom.Entity|label\n",
+    "#VALS=webanno.custom.Entity|label|*\n",
+]
+
+
+def _webanno_docs(paths):
+    # The WebAnno conversion needs per-type configuration for events and
+    # relations, so only entities are converted
+    from ..simplesplit import find_sentence_standoffs, find_token_standoffs
+    headers, vals = webanno_tsv.headers_from_lines(WEBANNO_HEADER)
+    for doc in _load(paths):
+        text = doc.get_document_text()
+        entities = ''.join(str(ann) for ann in doc.get_entities())
+        yield (TextAnnotations(text=text, source=entities), headers,
+               find_sentence_standoffs(text), find_token_standoffs(text),
+               vals)
+
+
+def bench_webanno_to_lines(paths):
+    args = list(_webanno_docs(paths))
+    with Timer() as timer:
+        for doc_args in args:
+            webanno_tsv.to_lines(*doc_args)
+    return timer.elapsed, len(args)
+
+
+def bench_webanno_from_lines(paths):
+    tsvs = [webanno_tsv.to_lines(*args) for args in _webanno_docs(paths)]
+    with Timer() as timer:
+        for lines in tsvs:
+            webanno_tsv.from_lines(lines)
+    return timer.elapsed, len(tsvs)
+
+
+def bench_get_doc_json(paths):
+    docs = _load(paths)
+    with Timer() as timer:
+        for doc in docs:
+            get_doc_json(doc, cache=None)
+    return timer.elapsed, len(docs)
+
+
+def bench_get_doc_json_cached(paths):
+    # Fetched again, with the standoffs remembered from the first time
+    docs = _load(paths)
+    cache = StandoffCache(maxsize=len(docs))
+    for doc in docs:
+        get_doc_json(doc, cache=cache)
+    with Timer() as timer:
+        for doc in docs:
+            get_doc_json(doc, cache=cache)
+    return timer.elapsed, len(docs)
+
+
+def bench_get_doc_json_window(paths, sentences=20):
+    # The first page of each document, with the standoffs remembered
+    docs = _load(paths)
+    cache = StandoffCache(maxsize=len(docs))
+    for doc in docs:
+        get_doc_summary(doc, cache=cache)
+    with Timer() as timer:
+        for doc in docs:
+            get_doc_json(doc, cache=cache, window=(0, sentences))
+    return timer.elapsed, len(docs)
+
+
+def bench_get_doc_json_delta(paths):
+    # What an editor fetches after changing one annotation
+    docs = _load(paths, read_only=False)
+    versions = []
+    for doc in docs:
+        versions.append(doc.version)
+        ann = next(doc.get_textbounds(), None)
+        if ann is not None:
+            doc.modify_annotation(ann, type='Changed')
+    with Timer() as timer:
+        for doc, version in zip(docs, versions):
+            get_doc_json_delta(doc, version)
+    return timer.elapsed, len(docs)
+
+
+def bench_export(paths):
+    # In this process, so as to time the work rather than the pool
+    with Timer() as timer:
+        export_corpus(paths, StringIO(), processes=0)
+    return timer.elapsed, len(paths)
+
+
+def bench_coll_json(paths, count=1000):
+    # A collection request for each of `count` documents, with the
+    # configuration unchanged since the first
+    with TemporaryDirectory() as tmp_dir:
+        visual_path = path_join(tmp_dir, 'visual.conf')
+        with open(visual_path, 'w') as w:
+            w.write('[labels]\n')
+            for type in ENTITY_TYPES + EVENT_TYPES:
+                w.write('%s | %s | %s\n' % (type, type, type[:3]))
+            w.write('[drawing]\n')
+            for type in ENTITY_TYPES + EVENT_TYPES:
+                w.write('%s\tbgColor:#7fa2ff\n' % type)
+        cache = ConfCache()
+        with Timer() as timer:
+            for _ in range(count):
+                cache.get(visual_path).coll_json
+    return timer.elapsed, count
+
+
+def _texts(paths):
+    texts = []
+    for path in paths:
+        with open(path + '.txt', encoding='utf-8') as r:
+            texts.append(r.read())
+    return texts
+
+
+def _splitter_bench(module_name, function_name):
+    def bench(paths):
+        # Raises ImportError if the splitter's dependencies are missing
+        function = getattr(
+            import_module('..' + module_name, __package__), function_name)
+        texts = _texts(paths)
+        with Timer() as timer:
+            for text in texts:
+                function(text)
+        return timer.elapsed, len(texts)
+    return bench
+
+
+def _refine_split_bench(chunk_size):
+    def bench(paths):
+        from ..ssplit import SENTENCE_END_REGEX, _sentence_boundary_gen
+        from ..sspostproc import refine_split
+        # The input `ssplit` gives it: one (unrefined) sentence per line
+        inputs = [
+            '\n'.join(text[start:end].replace('\n', ' ')
+                      for start, end in _sentence_boundary_gen(
+                          text, SENTENCE_END_REGEX))
+            for text in _texts(paths)
+        ]
+        with Timer() as timer:
+            for split_text in inputs:
+                refine_split(split_text, chunk_size=chunk_size)
+        return timer.elapsed, len(inputs)
+    return bench
+
+
+def bench_stream_ssplit(paths):
+    from ..ssplit import stream_sentence_boundary_gen
+    with Timer() as timer:
+        for path in paths:
+            with open(path + '.txt', encoding='utf-8') as r:
+                for _ in stream_sentence_boundary_gen(r, chunk_size=2000):
+                    pass
+    return timer.elapsed, len(paths)
+
+
+def _import_bench(module_name):
+    def bench(paths):
+        # In a fresh interpreter, as reported by `python -X importtime`
+        package = import_module('..', __package__)
+        env = dict(environ)
+        env['PYTHONPATH'] = dirname(package.__path__[0])
+        qualified_name = '%s.%s' % (package.__name__, module_name)
+        result = run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import ' + qualified_name],
+            stderr=PIPE, universal_newlines=True, env=env)
+        if result.returncode:
+            raise ImportError(result.stderr.strip().splitlines()[-1])
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == qualified_name:
+                return int(fields[1]) / 1e6, 1
+        raise ValueError("No import time reported for %s" % qualified_name)
+    return bench
+
+
+BENCHMARKS = {
+    'load': bench_load,
+    'sanity': bench_sanity,
+    'get_entities': bench_get_entities,
+    'del_annotation': bench_del_annotation,
+    'get_new_id': bench_get_new_id,
+    'read_write': _locking_bench(False),
+    'read_write_thread_safe': _locking_bench(True),
+    'save': bench_save,
+    'diff': bench_diff,
+    'webanno_to_lines': bench_webanno_to_lines,
+    'webanno_from_lines': bench_webanno_from_lines,
+    'get_doc_json': bench_get_doc_json,
+    'get_doc_json_cached': bench_get_doc_json_cached,
+    'get_doc_json_window': bench_get_doc_json_window,
+    'get_doc_json_delta': bench_get_doc_json_delta,
+    'export': bench_export,
+    'coll_json': bench_coll_json,
+    'refine_split': _refine_split_bench(None),
+    'refine_split_chunked': _refine_split_bench(2000),
+    'stream_ssplit': bench_stream_ssplit,
+}
+for _module_name in ('simplesplit', 'mecabsplit', 'sudachisplit'):
+    for _function_name in ('find_sentence_standoffs', 'find_token_standoffs'):
+        BENCHMARKS['%s.%s' % (_module_name, _function_name)] = \
+            _splitter_bench(_module_name, _function_name)
+for _module_info in iter_modules(import_module('..', __package__).__path__):
+    BENCHMARKS['import.%s' % _module_info.name] = \
+        _import_bench(_module_info.name)
+
+
+def run_benchmark(bench, paths, repeat=3):
+    """Run `bench` `repeat` times, and return a dict of its timings."""
+    runs = []
+    for _ in range(repeat):
+        seconds, ops = bench(paths)
+        runs.append(seconds)
+    return {
+        'ops': ops,
+        'runs': runs,
+        'min': min(runs),
+        'median': median(runs),
+        'mean': mean(runs),
+        'min_per_op': min(runs) / ops if ops else None,
+    }
+
+
+def run_suite(paths, repeat=3, names=None, corpus=None):
+    """Run the benchmarks `names` (all by default) over the documents at
+    `paths`, and return the results as a JSON-serialisable dict.
+    Benchmarks whose optional dependencies are missing are reported as
+    skipped. `corpus` is recorded as the corpus description."""
+    if names is None:
+        names = list(BENCHMARKS)
+    results = {}
+    for name in names:
+        try:
+            results[name] = run_benchmark(BENCHMARKS[name], paths, repeat)
+        except ImportError as e:
+            results[name] = {'skipped': str(e)}
+    return {
+        'meta': {
+            'time': time(),
+            'python': '%s %s' % (python_implementation(), python_version()),
+            'platform': platform(),
+            'bratpy': _version(),
+            'repeat': repeat,
+            'documents': len(paths),
+            'corpus': corpus,
+        },
+        'results': results,
+    }
+
+
+def _version():
+    try:
+        from importlib.metadata import version
+        return version('bratpy')
+    except Exception:
+        return None
+
+
+def compare(old, new):
+    """Return `{name: new_min / old_min}` for the benchmarks in both result
+    dicts (as returned by `run_suite`); above 1 means slower."""
+    ratios = {}
+    for name, new_result in new['results'].items():
+        old_result = old['results'].get(name)
+        if (old_result and 'min' in old_result and 'min' in new_result
+                and old_result['min']):
+            ratios[name] = new_result['min'] / old_result['min']
+    return ratios
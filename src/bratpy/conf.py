@@ -1,6 +1,11 @@
 import re
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from hashlib import blake2b
+from json import dumps
+from os import stat
+from threading import Lock
 from .annotation import IdedAnnotation
+from .json import get_coll_json
 
 
 SIMSTRING_DEFAULT_UNICODE = False
@@ -105,6 +110,74 @@ def parse_tools_conf(text):
     }
 
 
+def _file_stamp(filename):
+    # Changes when the file is (most probably) changed
+    if filename is None:
+        return None
+    st = stat(filename)
+    return st.st_mtime_ns, st.st_size
+
+
+class CollectionConf(object):
+    """The configuration of a collection, as read by `ConfCache`: the
+    parsed `visual_conf` and `tools_conf` (shared, not to be modified),
+    the `get_coll_json` of those as UTF-8 encoded JSON `coll_json`, and
+    `etag`, a quoted fingerprint of `coll_json` to serve as an HTTP ETag."""
+
+    __slots__ = ('visual_conf', 'tools_conf', 'coll_json', 'etag')
+
+    def __init__(self, visual_conf, tools_conf):
+        self.visual_conf = visual_conf
+        self.tools_conf = tools_conf
+        self.coll_json = dumps(
+            get_coll_json(visual_conf, tools_conf),
+            separators=(',', ':')).encode('utf-8')
+        self.etag = '"%s"' % blake2b(self.coll_json, digest_size=16).hexdigest()
+
+
+class ConfCache(object):
+    """Parsed collection configurations, by the paths of the visual and
+    tools configuration files, for the `maxsize` collections used last.
+    Files are read again when their modification time or size changes."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, visual_filename, tools_filename=None):
+        """Return the `CollectionConf` of the given files; without
+        `tools_filename`, the tools configuration is empty."""
+        key = (visual_filename, tools_filename)
+        # Taken before reading, so that a change made while reading is seen
+        # next time
+        stamps = _file_stamp(visual_filename), _file_stamp(tools_filename)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == stamps:
+                self._entries.move_to_end(key)
+                return cached[1]
+        visual_conf = parse_visual_conf_file(visual_filename)
+        if tools_filename is None:
+            tools_conf = parse_tools_conf('')
+        else:
+            tools_conf = parse_tools_conf_file(tools_filename)
+        conf = CollectionConf(visual_conf, tools_conf)
+        with self._lock:
+            self._entries[key] = (stamps, conf)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return conf
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+conf_cache = ConfCache()
+
+
 _NUMBERLESS_RE = re.compile(r'(.*?)\d*$')
 def _numberless(type):
     match = _NUMBERLESS_RE.match(type)
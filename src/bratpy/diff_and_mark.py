@@ -372,10 +372,11 @@ class AnnotationDiff:  # {{{
                 correspondence_hist[key][2].append(entity)
 
         seen = []
-        import operator
+        # Sort by count, then groups; a missing group (None) sorts first
         sorted_hist = sorted(
             iter(correspondence_hist.items()),
-            key=operator.itemgetter(1))
+            key=lambda item: (item[1][0], [
+                -1 if group is None else group for group in item[1][1]]))
         for key, equiv_item in sorted_hist:
             count, correspondence_pair, entities = equiv_item
             first_group, second_group = correspondence_pair
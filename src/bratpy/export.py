@@ -0,0 +1,136 @@
+'''
+Export the brat document data (see `json.get_doc_json`) of whole
+collections, one JSON object per line.
+
+    with open('corpus.ndjson', 'w', encoding='utf-8') as w:
+        export_corpus(find_documents(['data/']), w, omit=('annfile',))
+
+    python -m bratpy.export [-j 4] [--omit text] data/ > corpus.ndjson
+
+Documents are read, split and serialised by a pool of worker processes,
+and written in order as they come back; only a few documents per worker
+are held at any time, whatever the size of the corpus.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from functools import partial
+from json import dumps
+from os import cpu_count, walk
+from os.path import isdir, join as path_join
+
+from .annotation import KNOWN_FILE_SUFF, TEXT_FILE_SUFFIX, TextAnnotations
+from .json import get_doc_json
+from .offsets import OffsetsJSONEncoder
+from .splitters import DEFAULT_SPLITTER
+
+
+# Documents in flight per worker process: enough to keep the workers busy
+# while a slow document holds up the output
+PENDING_PER_WORKER = 4
+
+
+def find_documents(paths):
+    """Yield the documents (paths without extension) under `paths`, in
+    order: directories are searched recursively for text files with
+    annotations, and other paths are taken to be documents."""
+    for path in paths:
+        if not isdir(path):
+            yield path
+            continue
+        for directory, subdirs, files in walk(path):
+            subdirs.sort()
+            names = set(files)
+            for name in sorted(files):
+                document, dot, suff = name.rpartition('.')
+                if dot and suff == TEXT_FILE_SUFFIX and any(
+                        document + '.' + ann_suff in names
+                        for ann_suff in KNOWN_FILE_SUFF):
+                    yield path_join(directory, document)
+
+
+def get_doc_json_line(document, omit=(), splitter=DEFAULT_SPLITTER):
+    """Return the brat document data of `document` as a line of JSON, with
+    its path as `"document"`, and without the keys in `omit`."""
+    doc = TextAnnotations(document, read_only=True)
+    # Nothing is split twice in an export, so there is no point in caching;
+    # `Offsets` are smaller to send back from the workers
+    doc_data = get_doc_json(doc, splitter=splitter, cache=None, compact=True,
+                            omit=omit)
+    doc_data["document"] = document
+    return dumps(doc_data, cls=OffsetsJSONEncoder, ensure_ascii=False,
+                 separators=(',', ':')) + '\n'
+
+
+def export_corpus(documents, stream, omit=(), splitter=DEFAULT_SPLITTER,
+                  processes=None, max_pending=None):
+    """Write the `get_doc_json_line` of each of `documents` to `stream`, in
+    order, and return the number of documents written.
+
+    `processes` worker processes are used (by default, one per CPU; 0 does
+    everything in this process), each with at most `max_pending` documents
+    (by default `PENDING_PER_WORKER` per worker) read ahead of the output.
+    """
+    to_line = partial(get_doc_json_line, omit=tuple(omit), splitter=splitter)
+    count = 0
+    if processes == 0:
+        for document in documents:
+            stream.write(to_line(document))
+            count += 1
+        return count
+
+    if processes is None:
+        processes = cpu_count() or 1
+    if max_pending is None:
+        max_pending = PENDING_PER_WORKER * processes
+    pending = deque()
+    with ProcessPoolExecutor(processes) as executor:
+        for document in documents:
+            if len(pending) >= max_pending:
+                stream.write(pending.popleft().result())
+                count += 1
+            pending.append(executor.submit(to_line, document))
+        while pending:
+            stream.write(pending.popleft().result())
+            count += 1
+    return count
+
+
+def argparser():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(
+        description="Export the brat document data of collections as NDJSON")
+    ap.add_argument("paths", metavar="<path>", nargs="+",
+                    help="Collection directories or documents")
+    ap.add_argument("-o", "--output", help="Output file (default stdout)")
+    ap.add_argument("-j", "--processes", type=int,
+                    help="Worker processes (default one per CPU; 0 for none)")
+    ap.add_argument("--omit", action="append", default=[],
+                    choices=["text", "annfile", "token_offsets",
+                             "sentence_offsets"],
+                    help="Leave this key out (repeatable)")
+    ap.add_argument("--splitter", default=DEFAULT_SPLITTER,
+                    help="Sentence splitter and tokenizer (see `splitters`)")
+    return ap
+
+
+def main(argv=None):
+    import sys
+
+    if argv is None:
+        argv = sys.argv
+    args = argparser().parse_args(argv[1:])
+    documents = find_documents(args.paths)
+    if args.output is None:
+        export_corpus(documents, sys.stdout, args.omit, args.splitter,
+                      args.processes)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as w:
+            export_corpus(documents, w, args.omit, args.splitter,
+                          args.processes)
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv))
@@ -1,59 +1,185 @@
-from .simplesplit import find_sentence_standoffs, find_token_standoffs
+from bisect import bisect_left
+from itertools import chain
 
+from .annotation import (
+    AnnotationNotFoundError, Change, TextBoundAnnotation, EventAnnotation,
+    BinaryRelationAnnotation, AttributeAnnotation, NormalizationAnnotation,
+    OnelineCommentAnnotation)
+from .splitters import get_splitter, standoff_cache, DEFAULT_SPLITTER
 
 
-def get_doc_json(doc, sentence_standoffs=None, token_standoffs=None):
-    text = doc.get_document_text()
+# The rows of the brat document data, by kind of annotation
 
-    if sentence_standoffs is None:
-        sentence_standoffs = find_sentence_standoffs(text)
-    if token_standoffs is None:
-        token_standoffs = find_token_standoffs(text)
+def _span_row(ann):
+    return [ann.id, ann.type, ann.spans]
 
-    entity_doc_data = [
-        [ann.id, ann.type, ann.spans]
-        for ann in doc.get_entities()
-    ]
-    normalization_doc_data = [
-        [ann.id, ann.type, ann.target, ann.refdb, ann.refid, ann.tail]
-        for ann in doc.get_normalizations()
-    ]
-    event_doc_data = [
-        [ann.id, ann.trigger, ann.args]
-        for ann in doc.get_events()
-    ]
-    trigger_doc_data = [
-        [ann.id, ann.type, ann.spans]
-        for ann in doc.get_triggers()
-    ]
-    relation_doc_data = [
-        [ann.id, ann.type,
+
+def _normalization_row(ann):
+    return [ann.id, ann.type, ann.target, ann.refdb, ann.refid, ann.tail]
+
+
+def _event_row(ann):
+    return [ann.id, ann.trigger, ann.args]
+
+
+def _relation_row(ann):
+    return [ann.id, ann.type,
             [(ann.arg1l, ann.arg1),
-            (ann.arg2l, ann.arg2)]]
-        for ann in doc.get_relations()
-    ]
-    attribute_doc_data = [
-        [ann.id, ann.type, ann.target, ann.value]
-        for ann in doc.get_attributes()
+             (ann.arg2l, ann.arg2)]]
+
+
+def _attribute_row(ann):
+    return [ann.id, ann.type, ann.target, ann.value]
+
+
+def _comment_row(ann):
+    return [ann.target, ann.type, ann.tail]
+
+
+def _doc_data_kind(ann, trigger_ids):
+    # The key of the document data `ann` goes under (None if it is not
+    # sent), and its row; a text-bound is a trigger if its id is in
+    # `trigger_ids`
+    if isinstance(ann, TextBoundAnnotation):
+        if ann.id in trigger_ids:
+            return "triggers", _span_row(ann)
+        return "entities", _span_row(ann)
+    if isinstance(ann, EventAnnotation):
+        return "events", _event_row(ann)
+    if isinstance(ann, BinaryRelationAnnotation):
+        return "relations", _relation_row(ann)
+    if isinstance(ann, AttributeAnnotation):
+        return "attributes", _attribute_row(ann)
+    if isinstance(ann, NormalizationAnnotation):
+        return "normalizations", _normalization_row(ann)
+    if isinstance(ann, OnelineCommentAnnotation) and ann.type != 'STATUS':
+        return "comments", _comment_row(ann)
+    return None, None
+
+def _get_standoffs(doc, text, splitter, cache, compact):
+    # Found by `splitter` (see `splitters`), or taken from `cache` (a
+    # `StandoffCache`, or None not to cache); lists of `(start, end)` tuples,
+    # or with `compact`, `Offsets` (to be written with `OffsetsJSONEncoder`)
+    if cache is None:
+        return get_splitter(splitter).split(text, compact)
+    found = cache.get(
+        text, splitter, getattr(doc, '_text_file_path', None),
+        getattr(doc, '_stats', None))
+    if not compact:
+        found = [standoffs.tolist() for standoffs in found]
+    return found
+
+
+def _window_ids(doc, start, end):
+    # The ids of the text-bound annotations touching `start` to `end`, of
+    # the events and relations touching those, and of what they refer to
+    ids = set(doc._get_span_index().overlapping(start, end))
+    pending = [
+        ann for ann in chain(doc.get_events(), doc.get_relations())
+        if any(not ids.isdisjoint(deps) for deps in ann.get_deps())
     ]
-    comment_doc_data = [
-        [ann.target, ann.type, ann.tail]
-        for ann in doc.get_oneline_comments()
+    while pending:
+        ann = pending.pop()
+        ids.add(ann.id)
+        for deps in ann.get_deps():
+            for dep_id in deps - ids:
+                ids.add(dep_id)
+                try:
+                    pending.append(doc.get_ann_by_id(dep_id))
+                except AnnotationNotFoundError:
+                    pass
+    return ids
+
+
+def _starts(standoffs):
+    starts = getattr(standoffs, 'starts', None)
+    if starts is None:
+        starts = [start for start, _ in standoffs]
+    return starts
+
+
+def _rows(to_row, anns, include, key='id'):
+    # The rows of `anns` whose `key` attribute is in `include` (all of them
+    # if None)
+    return [
+        to_row(ann) for ann in anns
+        if include is None or getattr(ann, key) in include
     ]
-    doc_data = {
-        "entities": entity_doc_data,
-        "events": event_doc_data,
-        "relations": relation_doc_data,
-        "triggers": trigger_doc_data,
-        "modifications": [],
-        "attributes": attribute_doc_data,
-        "equivs": [],
-        "normalizations": normalization_doc_data,
-        "comments": comment_doc_data,
-        "text": text,
-        "annfile": str(doc),
-        "token_offsets": token_standoffs,
-        "sentence_offsets": sentence_standoffs,
+
+
+def _annfile(doc, include):
+    if include is None:
+        return str(doc)
+    return ''.join(
+        str(ann) for ann in doc
+        if getattr(ann, 'id', None) in include
+        or getattr(ann, 'target', None) in include)
+
+
+def get_doc_json(doc, sentence_standoffs=None, token_standoffs=None,
+                 splitter=DEFAULT_SPLITTER, cache=standoff_cache, compact=False,
+                 window=None, omit=()):
+    """Return the brat document data of `doc`.
+
+    The standoffs not given are found by `splitter`, or taken from `cache`
+    (see `_get_standoffs`).
+
+    With `window=(sent_from, sent_to)`, only sentences `sent_from` up to
+    (not including) `sent_to` are sent: their text (starting at
+    `"text_offset"`), sentences and tokens, and the annotations touching
+    them, along with those they refer to. Offsets stay those of the whole
+    document. `get_doc_summary` gives the number of sentences.
+
+    The keys in `omit` are left out, and not computed at all (the text is
+    only split if its offsets, or a window of it, are asked for).
+    """
+    text = doc.get_document_text()
+
+    need_standoffs = window is not None or not {
+        "token_offsets", "sentence_offsets"} <= set(omit)
+    if need_standoffs and (
+            sentence_standoffs is None or token_standoffs is None):
+        found = _get_standoffs(doc, text, splitter, cache, compact)
+        if sentence_standoffs is None:
+            sentence_standoffs = found[0]
+        if token_standoffs is None:
+            token_standoffs = found[1]
+
+    if window is None:
+        include = None
+    else:
+        sentence_count = len(sentence_standoffs)
+        sentence_standoffs = sentence_standoffs[window[0]:window[1]]
+        if len(sentence_standoffs):
+            text_start = sentence_standoffs[0][0]
+            text_end = sentence_standoffs[-1][1]
+        else:
+            text_start = text_end = len(text)
+        token_starts = _starts(token_standoffs)
+        token_standoffs = token_standoffs[
+            bisect_left(token_starts, text_start):
+            bisect_left(token_starts, text_end)]
+        include = _window_ids(doc, text_start, text_end)
+        text = text[text_start:text_end]
+
+    fields = {
+        "entities": lambda: _rows(_span_row, doc.get_entities(), include),
+        "events": lambda: _rows(_event_row, doc.get_events(), include),
+        "relations": lambda: _rows(
+            _relation_row, doc.get_relations(), include),
+        "triggers": lambda: _rows(_span_row, doc.get_triggers(), include),
+        "modifications": list,
+        "attributes": lambda: _rows(
+            _attribute_row, doc.get_attributes(), include, 'target'),
+        "equivs": list,
+        "normalizations": lambda: _rows(
+            _normalization_row, doc.get_normalizations(), include, 'target'),
+        "comments": lambda: _rows(
+            _comment_row, doc.get_oneline_comments(), include, 'target'),
+        "text": lambda: text,
+        "annfile": lambda: _annfile(doc, include),
+        "token_offsets": lambda: token_standoffs,
+        "sentence_offsets": lambda: sentence_standoffs,
         # "mtime": 1533538148.3611436,
         # "ctime": 1585644597.360524,
         # "source_files": [
@@ -64,10 +190,128 @@ def get_doc_json(doc, sentence_standoffs=None, token_standoffs=None):
         # "protocol": 1,
         # "messages": []
     }
+    doc_data = {
+        key: get_field() for key, get_field in fields.items()
+        if key not in omit
+    }
+    if window is not None:
+        doc_data["text_offset"] = text_start
+        doc_data["window"] = [window[0], window[1]]
+        doc_data["sentence_count"] = sentence_count
 
     return doc_data
 
 
+def get_doc_json_delta(doc, since, splitter=DEFAULT_SPLITTER,
+                       cache=standoff_cache, compact=False):
+    """Return the changes to the brat document data of `doc` since its
+    version `since` (the `"version"` of an earlier delta, or `doc.version`
+    when `get_doc_json` was called), or None if they are no longer all
+    remembered, and `get_doc_json` is needed again.
+
+    `"added"` and `"changed"` hold rows as `get_doc_json` has them, under
+    the same keys; a changed row replaces the one with the same id,
+    whatever its key was (a text-bound becomes a trigger when an event
+    comes to use it). `"removed"` holds, under the same keys, the first
+    element of the rows removed (the target, for comments). If the text was
+    edited, `"text"`, `"token_offsets"` and `"sentence_offsets"` are sent
+    again, as `get_doc_json` would.
+    """
+    changes = doc.get_changes(since)
+    if changes is None:
+        return None
+
+    # The net effect of the changes: the annotations that are new since,
+    # and those that are gone
+    added = {}
+    removed = {}
+    text_changed = False
+    for change in changes:
+        if change.kind == Change.TEXT:
+            text_changed = True
+            continue
+        if change.kind != Change.ADDED:
+            old_ann = change.ann if change.kind == Change.DELETED \
+                else change.old_ann
+            if old_ann in added:
+                del added[old_ann]
+            else:
+                removed[old_ann] = None
+        if change.kind != Change.DELETED:
+            if change.ann in removed:
+                del removed[change.ann]
+            else:
+                added[change.ann] = None
+
+    # Triggers of the events that changed may have become (or stopped
+    # being) triggers; they are sent again
+    retrigger_ids = {
+        ann.trigger for ann in chain(added, removed)
+        if isinstance(ann, EventAnnotation)
+    }
+    trigger_ids = {ann.trigger for ann in doc.get_events()}
+
+    added_data = {}
+    changed_data = {}
+    sent_ids = set()
+    removed_ids = {getattr(ann, 'id', None) for ann in removed}
+    for ann in added:
+        key, row = _doc_data_kind(ann, trigger_ids)
+        if key is None:
+            continue
+        sent_ids.add(ann.id)
+        data = changed_data if ann.id in removed_ids else added_data
+        data.setdefault(key, []).append(row)
+    for trigger_id in retrigger_ids - sent_ids:
+        try:
+            ann = doc.get_ann_by_id(trigger_id)
+        except AnnotationNotFoundError:
+            continue
+        key, row = _doc_data_kind(ann, trigger_ids)
+        if key is not None:
+            sent_ids.add(trigger_id)
+            changed_data.setdefault(key, []).append(row)
+
+    removed_data = {}
+    old_trigger_ids = trigger_ids | retrigger_ids
+    for ann in removed:
+        if getattr(ann, 'id', None) in sent_ids:
+            continue
+        key, row = _doc_data_kind(ann, old_trigger_ids)
+        if key is not None:
+            removed_data.setdefault(key, []).append(row[0])
+
+    delta = {
+        "since": since,
+        "version": changes[-1].version if changes else since,
+        "added": added_data,
+        "changed": changed_data,
+        "removed": removed_data,
+    }
+    if text_changed:
+        text = doc.get_document_text()
+        delta["text"] = text
+        delta["sentence_offsets"], delta["token_offsets"] = _get_standoffs(
+            doc, text, splitter, cache, compact)
+    return delta
+
+
+def get_doc_summary(doc, splitter=DEFAULT_SPLITTER, cache=standoff_cache):
+    """Return what is needed to page through `doc` with windowed
+    `get_doc_json`: its numbers of sentences and characters. The sentences
+    found are kept in `cache` for the windows."""
+    text = doc.get_document_text()
+    if cache is None:
+        sentence_standoffs = get_splitter(splitter).find_sentence_standoffs(
+            text, compact=True)
+    else:
+        sentence_standoffs, _ = _get_standoffs(doc, text, splitter, cache, True)
+    return {
+        "sentence_count": len(sentence_standoffs),
+        "text_length": len(text),
+    }
+
+
 def get_coll_json(visual_conf, tools_conf):
     # event_coll_data = [
     #     # {
@@ -1,9 +1,63 @@
+from array import array
+from itertools import accumulate
+from threading import local
+
 import MeCab
-from .standoffizer import Standoffizer
+from .offsets import Offsets
 from .simplesplit import find_sentence_standoffs
 
-wakati = MeCab.Tagger("-Owakati")
+# Taggers are not thread-safe, and loading the dictionary takes a while, so
+# each thread builds its own on first use
+_local = local()
+
+def get_tagger():
+    """Return the calling thread's `MeCab.Tagger("-Owakati")`."""
+    tagger = getattr(_local, 'tagger', None)
+    if tagger is None:
+        tagger = _local.tagger = MeCab.Tagger("-Owakati")
+    return tagger
+
+def warmup():
+    """Load the dictionary now rather than on the first tokenisation (in
+    the calling thread)."""
+    get_tagger()
+
+def __getattr__(name):
+    # `wakati` used to be built on import
+    if name == 'wakati':
+        return get_tagger()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+# 1 for the bytes that start a UTF-8 character, 0 for continuation bytes
+_CHAR_STARTS = bytes(int(not 0x80 <= byte < 0xc0) for byte in range(256))
+
+def _char_offsets(text):
+    # The character offset of each UTF-8 byte offset in `text`, or None if
+    # they are the same
+    encoded = text.encode('utf-8')
+    if len(encoded) == len(text):
+        return None
+    char_offsets = array('q', [0])
+    char_offsets.extend(accumulate(encoded.translate(_CHAR_STARTS)))
+    return char_offsets
 
-def find_token_standoffs(text):
-    tokens = wakati.parse(text).split()
-    return list(Standoffizer(text, tokens))
+def find_token_standoffs(text, compact=False):
+    # MeCab gives the length of each token in bytes, both without and with
+    # the whitespace skipped before it
+    char_offsets = _char_offsets(text)
+    starts = array('q')
+    ends = array('q')
+    pos = 0
+    node = get_tagger().parseToNode(text)
+    while node:
+        if node.stat not in (MeCab.MECAB_BOS_NODE, MeCab.MECAB_EOS_NODE):
+            pos += node.rlength
+            starts.append(pos - node.length)
+            ends.append(pos)
+        node = node.next
+    if char_offsets is not None:
+        starts = array('q', map(char_offsets.__getitem__, starts))
+        ends = array('q', map(char_offsets.__getitem__, ends))
+    if compact:
+        return Offsets(starts, ends)
+    return list(zip(starts, ends))
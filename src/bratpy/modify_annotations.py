@@ -1,16 +1,73 @@
-def _translate(offset, text, modifier):
-    orig_frag = text[:offset]
-    mod_frag = modifier(orig_frag)
-    return len(mod_frag)
+from copy import copy
+
+from .alignment import align
+from .annotation import (
+    TextBoundAnnotationWithText, AnnotationsIsReadOnlyError, DISCONT_SEP)
+
+
+def remap_annotations(doc, offset_map, new_text):
+    """Move the text-bound annotations of `doc` by `offset_map`, and make
+    their text match `new_text`. Spans whose text was deleted are dropped,
+    unless nothing would be left of the annotation; the annotations that
+    lost all of their text are returned.
+
+    Annotations that moved (or whose text changed) are replaced by moved
+    copies, so snapshots of `doc` are unaffected; the others are left
+    alone."""
+    collapsed = []
+    doc._begin_write()
+    try:
+        for ann in list(doc.get_textbounds()):
+            new_spans = []
+            for start, end in ann.spans:
+                start, end = offset_map.map_span(start, end)
+                if start < end:
+                    new_spans.append((start, end))
+            is_collapsed = not new_spans
+            if is_collapsed:
+                new_spans = [(start, start)]
+            has_text = isinstance(ann, TextBoundAnnotationWithText)
+            if has_text:
+                ann_text = DISCONT_SEP.join(
+                    new_text[start:end] for start, end in new_spans)
+            if new_spans == [tuple(span) for span in ann.spans] and (
+                    not has_text or ann_text == ann.text):
+                # Not moved; left as it is
+                continue
+            new_ann = copy(ann)
+            new_ann.spans = new_spans
+            if has_text:
+                new_ann.text = ann_text
+            if is_collapsed:
+                collapsed.append(new_ann)
+            doc._replace_annotation(ann, new_ann)
+    finally:
+        doc._end_write()
+    return collapsed
 
 
 def modify_annotations(doc, modifier):
-    text = doc._document_text
-    for ann in doc.get_textbounds():
-        new_spans = []
-        for start, end in ann.spans:
-            start = _translate(start, text, modifier)
-            end = _translate(end, text, modifier)
-            new_spans.append((start, end))
-        ann.spans = new_spans
-    doc._document_text = modifier(text)
+    """Replace the text of `doc` by `modifier(text)`, and move its text-bound
+    annotations along. If `modifier` has a `map` method (like the
+    normalisers in `normalizers`), it gives the new offsets; otherwise,
+    `modifier` is called once, on the whole text, and the offsets are found
+    by aligning the old and the new text (see `alignment.align`, which
+    raises `AlignmentError` if they differ too much).
+
+    The new text and the moved annotations make a single undo step."""
+    if doc._read_only:
+        raise AnnotationsIsReadOnlyError(doc.get_document())
+    doc._begin_write()
+    try:
+        text = doc._document_text
+        if hasattr(modifier, 'map'):
+            new_text, offset_map = modifier.map(text)
+        else:
+            new_text = modifier(text)
+            offset_map = align(text, new_text)
+        collapsed = remap_annotations(doc, offset_map, new_text)
+        if new_text != text:
+            doc._splice_text(0, text, new_text)
+    finally:
+        doc._end_write()
+    return collapsed
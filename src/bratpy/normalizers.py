@@ -0,0 +1,235 @@
+'''
+Text normalisers that know where every character went.
+
+A normaliser is called like a function, `normalizer(text)`, to get the
+normalised text; `normalizer.map(text)` returns the normalised text along
+with the `OffsetMap` from the original text to it, computed in the same
+pass, so that annotation spans can be moved without searching for them.
+`modify_annotations` and `webanno_tsv.from_lines` use `map` when the
+modifier they are given has one.
+
+Normalisers are combined with `|`, left to right:
+
+    normalize = strip_control | fullwidth_to_halfwidth | nfkc | collapse_whitespace
+'''
+
+import re
+from array import array
+from unicodedata import combining, normalize
+try:
+    from unicodedata import is_normalized
+except ImportError:
+    # Python < 3.8
+    def is_normalized(form, text):
+        return normalize(form, text) == text
+
+from .alignment import OffsetMap
+
+
+class Normalizer(object):
+    """Base class of normalisers; subclasses implement `map`."""
+
+    def __call__(self, text):
+        return self.map(text)[0]
+
+    def map(self, text):
+        """Return `(normalized_text, offset_map)`."""
+        raise NotImplementedError
+
+    def __or__(self, other):
+        return Chain(self, other)
+
+
+class Chain(Normalizer):
+    """Applies several normalisers in turn."""
+
+    def __init__(self, *normalizers):
+        self.normalizers = []
+        for normalizer in normalizers:
+            if isinstance(normalizer, Chain):
+                self.normalizers.extend(normalizer.normalizers)
+            else:
+                self.normalizers.append(normalizer)
+
+    def __call__(self, text):
+        for normalizer in self.normalizers:
+            text = normalizer(text)
+        return text
+
+    def map(self, text):
+        offset_map = None
+        for normalizer in self.normalizers:
+            new_text, step_map = normalizer.map(text)
+            # Normalisers return the very same text when there is nothing to
+            # do, and then there is nothing to compose either
+            if new_text is not text:
+                if offset_map is None:
+                    offset_map = step_map
+                else:
+                    offset_map = offset_map.compose(step_map)
+                text = new_text
+        if offset_map is None:
+            offset_map = OffsetMap.identity(len(text))
+        return text, offset_map
+
+
+def _replace_matches(text, matches, replace, parts=None):
+    # Replace every match by `replace(match)`, mapping the offsets of the
+    # unchanged text one to one, and those inside a match evenly over its
+    # replacement; or over each of the `(length, new_length)` parts that
+    # `parts(match, replacement)` splits the match into
+    pieces = []
+    starts = array('q')
+    pos = 0
+    shift = 0
+    for match in matches:
+        start, end = match.span()
+        replacement = replace(match)
+        pieces.append(text[pos:start])
+        starts.extend(range(pos + shift, start + shift))
+        new_start = start + shift
+        if parts is None:
+            match_parts = [(end - start, len(replacement))]
+        else:
+            match_parts = parts(match, replacement)
+        for length, new_length in match_parts:
+            starts.extend(new_start + k * new_length // length
+                          for k in range(length))
+            new_start += new_length
+        pieces.append(replacement)
+        shift += len(replacement) - (end - start)
+        pos = end
+    if not pieces:
+        return text, OffsetMap.identity(len(text))
+    pieces.append(text[pos:])
+    starts.extend(range(pos + shift, len(text) + shift + 1))
+    return ''.join(pieces), OffsetMap(starts)
+
+
+class RegexNormalizer(Normalizer):
+    """Replaces the (non-empty) matches of `pattern` by `replacement`, a
+    string or a function of the match."""
+
+    def __init__(self, pattern, replacement):
+        self.regex = re.compile(pattern)
+        if callable(replacement):
+            self.replace = replacement
+        else:
+            self.replace = lambda match: replacement
+
+    def __call__(self, text):
+        return self.regex.sub(self.replace, text)
+
+    def map(self, text):
+        return _replace_matches(text, self.regex.finditer(text), self.replace)
+
+
+class CollapseWhitespace(RegexNormalizer):
+    """Turns every run of whitespace into a single space; with
+    `newlines=True`, newlines are kept (and runs are only collapsed on
+    either side of them)."""
+
+    def __init__(self, newlines=True):
+        if newlines:
+            pattern = r'[^\S\n]{2,}|[^\S \n]'
+        else:
+            pattern = r'\s{2,}|[^\S ]'
+        RegexNormalizer.__init__(self, pattern, ' ')
+
+
+class StripControl(RegexNormalizer):
+    """Deletes the C0 and C1 control characters, other than tab, newline
+    and carriage return."""
+
+    def __init__(self):
+        RegexNormalizer.__init__(
+            self, r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]+', '')
+
+
+class FullwidthToHalfwidth(Normalizer):
+    """Turns full-width ASCII variants (and the ideographic space) into
+    ASCII. This never changes the length of the text."""
+
+    TABLE = dict(
+        [(code, code - 0xfee0) for code in range(0xff01, 0xff5f)]
+        + [(0x3000, 0x20)])
+
+    _fullwidth_re = re.compile('[\uff01-\uff5e\u3000]')
+
+    def __call__(self, text):
+        if not self._fullwidth_re.search(text):
+            return text
+        return text.translate(self.TABLE)
+
+    def map(self, text):
+        return self(text), OffsetMap.identity(len(text))
+
+
+class NFKC(Normalizer):
+    """Unicode NFKC normalisation.
+
+    Only the stretches of non-ASCII text (with the character before them,
+    which combining marks may compose with) are normalised; each
+    character, with the combining marks that follow it, is mapped on its
+    own where that gives the same result, and the whole stretch evenly
+    otherwise.
+    """
+
+    _non_ascii_re = re.compile(r'[^\x00-\x7f]')
+    _segment_re = re.compile(r'[\x00-\x7f]?[^\x00-\x7f]+')
+
+    def __call__(self, text):
+        return normalize('NFKC', text)
+
+    def map(self, text):
+        if not self._non_ascii_re.search(text) or is_normalized('NFKC', text):
+            return text, OffsetMap.identity(len(text))
+        normalized = {}
+        matches = []
+        for match in self._segment_re.finditer(text):
+            segment = match.group()
+            segment_normalized = normalize('NFKC', segment)
+            if segment_normalized != segment:
+                normalized[match.start()] = segment_normalized
+                matches.append(match)
+        return _replace_matches(
+            text, matches, lambda match: normalized[match.start()],
+            self._parts)
+
+    @staticmethod
+    def _parts(match, normalized):
+        # Each character with its combining marks, if normalising them
+        # separately adds up to `normalized`; else the part of the segment
+        # that changed
+        segment = match.group()
+        clusters = []
+        cluster_start = 0
+        for pos in range(1, len(segment)):
+            if not combining(segment[pos]):
+                clusters.append(segment[cluster_start:pos])
+                cluster_start = pos
+        clusters.append(segment[cluster_start:])
+        pieces = [normalize('NFKC', cluster) for cluster in clusters]
+        if ''.join(pieces) != normalized:
+            # Only spread what actually changed
+            prefix = 0
+            limit = min(len(segment), len(normalized))
+            while prefix < limit and segment[prefix] == normalized[prefix]:
+                prefix += 1
+            suffix = 0
+            limit -= prefix
+            while (suffix < limit
+                   and segment[-1 - suffix] == normalized[-1 - suffix]):
+                suffix += 1
+            return ([(1, 1)] * prefix
+                    + [(len(segment) - prefix - suffix,
+                        len(normalized) - prefix - suffix)]
+                    + [(1, 1)] * suffix)
+        return [(len(cluster), len(piece))
+                for cluster, piece in zip(clusters, pieces)]
+
+
+nfkc = NFKC()
+fullwidth_to_halfwidth = FullwidthToHalfwidth()
+collapse_whitespace = CollapseWhitespace()
+strip_control = StripControl()
@@ -0,0 +1,96 @@
+'''
+Compact sequences of `(start, end)` offsets.
+
+An `Offsets` holds the starts and the ends in two `array('q')`s (16 bytes
+an offset pair, where a list of tuples takes about 100), and still looks
+like a sequence of pairs. Slices share the arrays; `starts` and `ends` can
+be bisected directly. Splitters return them when asked to be `compact`
+(see `splitters`), and `StandoffCache` keeps them; `OffsetsJSONEncoder`
+writes them as JSON.
+'''
+
+from array import array
+from json import JSONEncoder
+
+
+def _as_array(values):
+    # `values` as an `array('q')`, copying as little as possible
+    if isinstance(values, array):
+        return values
+    if isinstance(values, memoryview):
+        return array('q', values.tobytes())
+    return array('q', values)
+
+
+class Offsets(object):
+    """A sequence of `(start, end)` pairs."""
+
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, starts=(), ends=()):
+        # Arrays, or memoryviews of them (for slices)
+        if not isinstance(starts, memoryview):
+            starts = _as_array(starts)
+        if not isinstance(ends, memoryview):
+            ends = _as_array(ends)
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Return the `Offsets` of the `(start, end)` `pairs`, which are
+        appended to the arrays one by one, so that a generator of them is
+        never held in full."""
+        if isinstance(pairs, cls):
+            return pairs
+        starts = array('q')
+        ends = array('q')
+        append_start = starts.append
+        append_end = ends.append
+        for start, end in pairs:
+            append_start(start)
+            append_end(end)
+        return cls(starts, ends)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Offsets(memoryview(self.starts)[index],
+                           memoryview(self.ends)[index])
+        return self.starts[index], self.ends[index]
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def __eq__(self, other):
+        try:
+            if len(self) != len(other):
+                return False
+            return all(pair == tuple(other_pair)
+                       for pair, other_pair in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Offsets(%r)' % list(self)
+
+    def __reduce__(self):
+        # Memoryviews cannot be pickled
+        return Offsets, (_as_array(self.starts), _as_array(self.ends))
+
+    def tolist(self):
+        """Return a list of `(start, end)` tuples."""
+        return list(zip(self.starts, self.ends))
+
+
+class OffsetsJSONEncoder(JSONEncoder):
+    """Writes `Offsets` as lists of `[start, end]` pairs."""
+
+    def default(self, o):
+        if isinstance(o, Offsets):
+            return o.tolist()
+        return JSONEncoder.default(self, o)
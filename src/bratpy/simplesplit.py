@@ -1,16 +1,20 @@
 import re
+from .offsets import Offsets
 from .ssplit import regex_sentence_boundary_gen
 
 
 
-def find_sentence_standoffs(text):
-    return list(regex_sentence_boundary_gen(text))
+def find_sentence_standoffs(text, compact=False):
+    standoffs = regex_sentence_boundary_gen(text)
+    if compact:
+        return Offsets.from_pairs(standoffs)
+    return list(standoffs)
 
 
 NONSPACE_RE = re.compile(r'\S+')
-def find_token_standoffs(text, pattern=NONSPACE_RE):
+def find_token_standoffs(text, pattern=NONSPACE_RE, compact=False):
     # simple whitespace tokenizer is good enough as default
-    return [
-        (match.start(), match.end())
-        for match in pattern.finditer(text)
-    ]
+    standoffs = (match.span() for match in pattern.finditer(text))
+    if compact:
+        return Offsets.from_pairs(standoffs)
+    return list(standoffs)
@@ -0,0 +1,246 @@
+'''
+Sentence splitters and tokenizers, by name.
+
+    splitter = get_splitter('mecab')
+    sentence_standoffs, token_standoffs = splitter.split(text)
+    for sentence_standoffs, token_standoffs in splitter.split_many(texts):
+        ...
+
+`simple` (regular expressions and whitespace), `mecab` and `sudachi` are
+registered; others can be added with `register_splitter`. The backend
+modules are only imported on first use, so their dependencies stay
+optional. `json.get_doc_json` and `webanno_tsv.to_lines` take a splitter
+name (or `Splitter`) for the standoffs they are not given.
+
+`StandoffCache` remembers the standoffs by text and splitter;
+`get_doc_json` uses `standoff_cache` unless told otherwise.
+'''
+
+from collections import OrderedDict
+from functools import partial
+from hashlib import blake2b
+from importlib import import_module
+from json import dump, load
+from os import getpid, replace
+from threading import Lock, get_ident
+
+from . import annotation
+from .offsets import Offsets, OffsetsJSONEncoder
+
+
+class Splitter(object):
+    """Base class of splitter backends; subclasses implement
+    `find_sentence_standoffs` and `find_token_standoffs` (returning lists of
+    `(start, end)` tuples, or with `compact`, `Offsets`), and `warmup` if
+    they have setup worth doing ahead of time."""
+
+    def find_sentence_standoffs(self, text, compact=False):
+        raise NotImplementedError
+
+    def find_token_standoffs(self, text, compact=False):
+        raise NotImplementedError
+
+    def warmup(self):
+        """Do the backend's setup now rather than on first use."""
+        pass
+
+    def split(self, text, compact=False):
+        """Return `(sentence_standoffs, token_standoffs)` of `text`, as
+        lists of `(start, end)` tuples, or with `compact` as `Offsets`."""
+        sentence_standoffs = self.find_sentence_standoffs(text, compact)
+        token_standoffs = self.find_token_standoffs(text, compact)
+        if compact:
+            return sentence_standoffs, token_standoffs
+        return list(sentence_standoffs), list(token_standoffs)
+
+    def split_many(self, texts, pool=None, compact=False):
+        """Return the `split` of each of `texts`, in order.
+
+        With `pool` (anything with a `map` method, such as
+        `multiprocessing.Pool` or `concurrent.futures.ThreadPoolExecutor`),
+        this is just `pool.map` of `split` over the texts, one text per
+        task. The mecab and sudachi backends keep a tagger per thread, so
+        each worker builds its own when it splits its first text. Process
+        pools pickle the splitter, which should then be registered on
+        import wherever the workers look for it by name.
+        """
+        if pool is None:
+            self.warmup()
+            return [self.split(text, compact) for text in texts]
+        return list(pool.map(partial(self.split, compact=compact), texts))
+
+
+class ModuleSplitter(Splitter):
+    """A backend module with `find_sentence_standoffs(text, compact=False)`
+    and `find_token_standoffs(text, compact=False)` functions (and
+    optionally `warmup()`), imported on first use."""
+
+    def __init__(self, module_name, package=__package__):
+        # Only names are kept, so that the splitter can be pickled
+        self.module_name = module_name
+        self.package = package
+
+    @property
+    def module(self):
+        return import_module(self.module_name, self.package)
+
+    def find_sentence_standoffs(self, text, compact=False):
+        return self.module.find_sentence_standoffs(text, compact=compact)
+
+    def find_token_standoffs(self, text, compact=False):
+        return self.module.find_token_standoffs(text, compact=compact)
+
+    def warmup(self):
+        warmup = getattr(self.module, 'warmup', None)
+        if warmup is not None:
+            warmup()
+
+
+SPLITTERS = {}
+DEFAULT_SPLITTER = 'simple'
+
+
+def register_splitter(name, splitter):
+    SPLITTERS[name] = splitter
+
+
+def get_splitter(splitter=DEFAULT_SPLITTER):
+    """Return the splitter registered as `splitter`; a `Splitter` is
+    returned as it is."""
+    if not isinstance(splitter, str):
+        return splitter
+    try:
+        return SPLITTERS[splitter]
+    except KeyError:
+        raise ValueError("Unknown splitter: %s (known: %s)" % (
+            splitter, ', '.join(sorted(SPLITTERS))))
+
+
+register_splitter('simple', ModuleSplitter('.simplesplit'))
+register_splitter('mecab', ModuleSplitter('.mecabsplit'))
+register_splitter('sudachi', ModuleSplitter('.sudachisplit'))
+
+
+# Appended to the path of the `.txt` file for the cache sidecar file
+SIDECAR_SUFFIX = '.standoffs.json'
+# The most memory the standoffs kept by a `StandoffCache` may take, by
+# default (an `Offsets` takes 16 bytes a standoff)
+DEFAULT_CACHE_BYTES = 64 * 2 ** 20
+
+
+class StandoffCache(object):
+    """The standoffs found by splitters, by a hash of the text and the
+    splitter, for the `maxsize` texts used last, as long as they take no
+    more than `max_bytes` in all (standoffs larger than that on their own
+    are not kept).
+
+    With `sidecar`, standoffs are also kept in a JSON file next to the text
+    file they were found for (if given, and only for splitters given by
+    name), so that they outlive the process.
+    """
+
+    def __init__(self, maxsize=128, sidecar=False,
+                 max_bytes=DEFAULT_CACHE_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sidecar = sidecar
+        self._entries = OrderedDict()
+        # The bytes taken by the standoffs in `_entries`
+        self._bytes = 0
+        self._lock = Lock()
+
+    def get(self, text, splitter=DEFAULT_SPLITTER, path=None, stats=None):
+        """Return `(sentence_standoffs, token_standoffs)` of `text` (as
+        `Offsets`), split by `splitter` unless remembered. `path` is that of
+        the text file, for the sidecar; hits are counted in `stats` (a
+        document's `Stats`, if it collects them), and in the global stats
+        if stats are enabled (see `annotation.enable_stats`)."""
+        text_hash = blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        key = (text_hash, splitter)
+        with self._lock:
+            standoffs = self._entries.get(key)
+            if standoffs is not None:
+                self._entries.move_to_end(key)
+        sidecar_path = None
+        if self.sidecar and path is not None and isinstance(splitter, str):
+            sidecar_path = path + SIDECAR_SUFFIX
+        if standoffs is None and sidecar_path is not None:
+            standoffs = self._read_sidecar(sidecar_path, text_hash, splitter)
+        if standoffs is None:
+            standoffs = get_splitter(splitter).split(text, compact=True)
+            if sidecar_path is not None:
+                self._write_sidecar(
+                    sidecar_path, text_hash, splitter, standoffs)
+        else:
+            if stats is not None:
+                stats.count('cache_hits')
+            if annotation._stats_enabled:
+                # Looked up now, as `reset_global_stats` replaces it
+                annotation.GLOBAL_STATS.add(
+                    {'timers': {}, 'counters': {'cache_hits': 1}})
+        size = self._size(standoffs)
+        if size > self.max_bytes:
+            return standoffs
+        with self._lock:
+            old_standoffs = self._entries.pop(key, None)
+            if old_standoffs is not None:
+                self._bytes -= self._size(old_standoffs)
+            self._entries[key] = standoffs
+            self._bytes += size
+            while (len(self._entries) > self.maxsize
+                   or self._bytes > self.max_bytes):
+                _, old_standoffs = self._entries.popitem(last=False)
+                self._bytes -= self._size(old_standoffs)
+        return standoffs
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @staticmethod
+    def _size(standoffs):
+        return sum(
+            offsets.starts.itemsize * 2 * len(offsets)
+            for offsets in standoffs)
+
+    @staticmethod
+    def _load_sidecar(sidecar_path, text_hash):
+        # The standoffs by splitter name, if the sidecar is for this text
+        try:
+            with open(sidecar_path, encoding='utf-8') as r:
+                data = load(r)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('hash') != text_hash:
+            return {}
+        return data.get('splitters', {})
+
+    def _read_sidecar(self, sidecar_path, text_hash, splitter):
+        entry = self._load_sidecar(sidecar_path, text_hash).get(splitter)
+        if entry is None:
+            return None
+        return (Offsets.from_pairs(entry['sentences']),
+                Offsets.from_pairs(entry['tokens']))
+
+    def _write_sidecar(self, sidecar_path, text_hash, splitter, standoffs):
+        # Keeps the other splitters' standoffs for the same text; written to
+        # a temporary file first, so that readers never see half of it
+        entries = self._load_sidecar(sidecar_path, text_hash)
+        entries[splitter] = {
+            'sentences': standoffs[0],
+            'tokens': standoffs[1],
+        }
+        tmp_path = '%s.%d.%d.tmp' % (sidecar_path, getpid(), get_ident())
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as w:
+                dump({'hash': text_hash, 'splitters': entries}, w,
+                     cls=OffsetsJSONEncoder)
+            replace(tmp_path, sidecar_path)
+        except OSError:
+            # The cache is only an optimisation (the directory may well be
+            # read-only)
+            pass
+
+
+standoff_cache = StandoffCache()
@@ -10,9 +10,10 @@ Author:     Pontus Stenetorp <pontus stenetorp se>
 Version:    2011-05-09
 """
 
+from bisect import bisect_left
 from re import compile as re_compile
 from re import DOTALL, VERBOSE
-from .sspostproc import refine_split
+from .sspostproc import refine_split, safe_cuts, DEFAULT_CHUNK_SIZE
 
 # Constants
 # Reasonably well-behaved sentence end regular expression
@@ -49,16 +50,20 @@ SENTENCE_END_NEWLINE_REGEX = re_compile(r'''
             (:?(?=\s*$))
         )
     ''', DOTALL | VERBOSE)
+NEWLINE_REGEX = re_compile(r'\n')
 ###
 
 
-def _refine_split(offsets, original_text):
+def _refine_split(offsets, original_text, partial=False):
     # Postprocessor expects newlines, so add. Also, replace
     # sentence-internal newlines with spaces not to confuse it.
+    # With `partial`, `original_text` is followed by more text, and None is
+    # returned unless the refined sentences and the offsets end together,
+    # as they then do in the whole text.
     new_text = '\n'.join((original_text[o[0]:o[1]].replace('\n', ' ')
                           for o in offsets))
 
-    output = refine_split(new_text)
+    output = refine_split(new_text, chunk_size=DEFAULT_CHUNK_SIZE)
 
     # Align the texts and see where our offsets don't match
     old_offsets = offsets[::-1]
@@ -67,13 +72,20 @@ def _refine_split(offsets, original_text):
     if len(old_offsets) == 0:
         old_offsets.append((0, len(original_text), ))
     new_offsets = []
-    for refined_sentence in output.split('\n'):
-        new_offset = old_offsets.pop()
-        # Merge the offsets if we have received a corrected split
-        while new_offset[1] - new_offset[0] < len(refined_sentence) - 1:
-            _, next_end = old_offsets.pop()
-            new_offset = (new_offset[0], next_end)
-        new_offsets.append(new_offset)
+    try:
+        for refined_sentence in output.split('\n'):
+            new_offset = old_offsets.pop()
+            # Merge the offsets if we have received a corrected split
+            while new_offset[1] - new_offset[0] < len(refined_sentence) - 1:
+                _, next_end = old_offsets.pop()
+                new_offset = (new_offset[0], next_end)
+            new_offsets.append(new_offset)
+    except IndexError:
+        if partial:
+            return None
+        raise
+    if partial and old_offsets:
+        return None
 
     # Protect against missing document-final newline causing the last
     #   sentence to fall out of offset scope
@@ -85,30 +97,29 @@ def _refine_split(offsets, original_text):
             new_offsets.append((start, len(original_text) - 1))
 
     # Finally, inject new-lines from the original document as to respect the
-    #   original formatting where it is made explicit.
-    last_newline = -1
-    while True:
-        try:
-            orig_newline = original_text.index('\n', last_newline + 1)
-        except ValueError:
-            # No more newlines
-            break
-
-        for o_start, o_end in new_offsets:
-            if o_start <= orig_newline < o_end:
-                # We need to split the existing offsets in two
-                new_offsets.remove((o_start, o_end))
-                new_offsets.extend(((o_start, orig_newline, ),
-                                    (orig_newline + 1, o_end), ))
-                break
-            elif o_end == orig_newline:
-                # We have already respected this newline
-                break
-        else:
-            # Stand-alone "null" sentence, just insert it
-            new_offsets.append((orig_newline, orig_newline, ))
-
-        last_newline = orig_newline
+    #   original formatting where it is made explicit. The offsets do not
+    #   overlap, so going through them and the newlines together, in order,
+    #   each newline either ends an offset (and is already respected), splits
+    #   the offset it falls in, or stands alone as a "null" sentence.
+    newlines = [match.start() for match in NEWLINE_REGEX.finditer(original_text)]
+    nl_ix = 0
+    prev_end = None
+    split_offsets = []
+    for o_start, o_end in sorted(new_offsets):
+        while nl_ix < len(newlines) and newlines[nl_ix] < o_start:
+            if newlines[nl_ix] != prev_end:
+                split_offsets.append((newlines[nl_ix], newlines[nl_ix], ))
+            nl_ix += 1
+        while nl_ix < len(newlines) and newlines[nl_ix] < o_end:
+            split_offsets.append((o_start, newlines[nl_ix], ))
+            o_start = newlines[nl_ix] + 1
+            nl_ix += 1
+        split_offsets.append((o_start, o_end, ))
+        prev_end = o_end
+    for orig_newline in newlines[nl_ix:]:
+        if orig_newline != prev_end:
+            split_offsets.append((orig_newline, orig_newline, ))
+    new_offsets = split_offsets
 
     new_offsets.sort()
     return new_offsets
@@ -125,6 +136,75 @@ def regex_sentence_boundary_gen(text):
         yield o
 
 
+def _text_chunks(source, chunk_size):
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    elif hasattr(source, 'read'):
+        for chunk in iter(lambda: source.read(chunk_size), ''):
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
+def stream_sentence_boundary_gen(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Like `regex_sentence_boundary_gen`, but for text read a chunk at a
+    time from `source`: a string, a text file, or an iterable of strings.
+    Offsets into the whole text are yielded as soon as the sentences are
+    known not to depend on what is still to come.
+
+    Only the text since the last cut is kept. The text is cut between
+    sentences that the postprocessing heuristics could not join (see
+    `sspostproc.safe_cuts`), and where the refined sentences line up with
+    the unrefined ones again, so that the result is the same as splitting
+    the whole text at once.
+    """
+    buf = ''
+    # Offset of `buf` in the whole text
+    base = 0
+    # Size `buf` has to reach before trying to cut it
+    next_try = 2 * chunk_size
+    for chunk in _text_chunks(source, chunk_size):
+        buf += chunk
+        if len(buf) < next_try:
+            continue
+        # Every sentence but the last is followed by more text, so ends
+        # the same as it would in the whole text
+        offsets = [_o for _o in _sentence_boundary_gen(buf, SENTENCE_END_REGEX)]
+        if offsets:
+            offsets.pop()
+        # Find the cuts in the text given to the postprocessor, and the
+        # sentences they come before
+        lines = [buf[o[0]:o[1]].replace('\n', ' ') for o in offsets]
+        line_starts = [0]
+        for line in lines:
+            line_starts.append(line_starts[-1] + len(line) + 1)
+        start = 0
+        start_ix = 0
+        for cut in safe_cuts('\n'.join(lines), chunk_size, open_end=True):
+            cut_ix = bisect_left(line_starts, cut + 1)
+            end = offsets[cut_ix][0]
+            split_offsets = _refine_split(
+                [(o_start - start, o_end - start)
+                 for o_start, o_end in offsets[start_ix:cut_ix]],
+                buf[start:end], partial=True)
+            if split_offsets is None:
+                # Try again with the text up to the next cut
+                continue
+            for o_start, o_end in split_offsets:
+                yield base + start + o_start, base + start + o_end
+            start = end
+            start_ix = cut_ix
+        buf = buf[start:]
+        base += start
+        # Let what is left at least double before trying again, so that
+        # text with no safe cuts is not searched over and over
+        next_try = 2 * max(chunk_size, len(buf))
+    for o_start, o_end in regex_sentence_boundary_gen(buf):
+        yield base + o_start, base + o_end
+
+
 def newline_sentence_boundary_gen(text):
     for o in _sentence_boundary_gen(text, SENTENCE_END_NEWLINE_REGEX):
         yield o
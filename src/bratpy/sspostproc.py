@@ -97,13 +97,186 @@ __final.append(
 __final.append((re.compile(r'(\.\s*)\n(\s*,)'), r'\1 \2'))
 
 
-def refine_split(s):
+# Chunk size for long texts (see `refine_split`)
+DEFAULT_CHUNK_SIZE = 10000
+
+__brackets = re.compile(r'[\(\)\[\]]')
+# Endings of the abbreviations the heuristics join the next line to
+__abbreviation_end = re.compile(
+    r'\b(?:e\. ?g|i\. ?e|i\. ?v|vs|cf|Dr|Mr|Ms|Mrs|[Aa]pprox|[Nn]o|[Ff]igs?'
+    r'|[A-Z])\.$')
+
+
+def __is_safe_cut(s, pos):
+    # Whether the newline at `pos` is out of reach of all the heuristics but
+    # the bracket ones, so that the text on either side of it can be refined
+    # separately
+    if pos == 0 or pos + 1 >= len(s):
+        return False
+    prev_char, next_char = s[pos - 1], s[pos + 1]
+    # Whitespace around it (or a comma after it) could let a heuristic
+    # reach it from another newline
+    if prev_char.isspace() or next_char.isspace() or next_char == ',':
+        return False
+    # Lines continued by a lowercase word or a number
+    if next_char.islower() or next_char.isdigit() or next_char in '.!?':
+        return False
+    # Lines of only sentence-ending punctuation
+    punct_start = pos
+    while punct_start > 0 and s[punct_start - 1] in '.!?':
+        punct_start -= 1
+    if punct_start < pos and (punct_start == 0 or s[punct_start - 1] == '\n'):
+        return False
+    return not __abbreviation_end.search(s, max(0, pos - 9), pos)
+
+
+# The bracket heuristics allow up to 250 characters (or inner bracketed
+# groups) on either side of the newline they remove
+__reach = 2 * 250 + 1
+
+
+def __bracket_walks(s, positions, open_end):
+    # For each gap `g` between the same-kind bracket `positions` (the one
+    # just before `positions[g]`), where walking from a position `x` in it
+    # back (or forward) to the nearest unmatched bracket ends, skipping the
+    # groups without brackets inside, as `(bracket index, units, nested)`,
+    # or None if there is no such bracket: the characters and groups
+    # skipped are `x - positions[g - 1] - 1 + units` going back, and
+    # `positions[g] - x - 1 + units` going forward. With `open_end`, `s` may
+    # go on, and running out of brackets going forward ends with a bracket
+    # index of None (and `len(s)` in place of `positions[g]`). Found in one
+    # pass each way, each walk going on from where a shorter one ended
+    count = len(positions)
+    is_open = [s[pos] in '([' for pos in positions]
+    back = [None] * (count + 1)
+    for g in range(1, count + 1):
+        if is_open[g - 1]:
+            back[g] = (g - 1, 0, False)
+        elif g >= 3 and is_open[g - 2] and back[g - 2] is not None:
+            # An inner group; go on from its opening bracket
+            bracket, units, _ = back[g - 2]
+            back[g] = (bracket, 1 + positions[g - 2] - positions[g - 3] - 1
+                       + units, True)
+    forward = [None] * (count + 1)
+    if open_end:
+        forward[count] = (None, 0, False)
+    for g in range(count - 1, -1, -1):
+        if not is_open[g]:
+            forward[g] = (g, 0, False)
+        elif g + 1 == count:
+            if open_end:
+                forward[g] = (None, 1, True)
+        elif not is_open[g + 1] and forward[g + 2] is not None:
+            # An inner group; go on from its closing bracket
+            bracket, units, _ = forward[g + 2]
+            end = positions[g + 2] if g + 2 < count else len(s)
+            forward[g] = (bracket, 1 + end - positions[g + 1] - 1 + units,
+                          True)
+    return back, forward
+
+
+def __in_brackets(s, pos, positions_by_kind, walks, gaps, open_end=False):
+    # Whether any of the bracket heuristics could remove a newline across
+    # `pos`, i.e. whether `pos` is inside brackets as far as they can tell;
+    # with `open_end`, whether they could, whatever follows `s`. `gaps`
+    # gives the index of the first bracket (of any kind, or of each kind)
+    # after `pos`, and `walks` the `__bracket_walks` of each kind
+    all_positions = positions_by_kind[None]
+    ix = gaps[None]
+    if 0 < ix < len(all_positions):
+        # Unlimited reach if there are no other brackets in between
+        pair = s[all_positions[ix - 1]] + s[all_positions[ix]]
+        if pair in ('()', '[]'):
+            return True
+    elif 0 < ix and open_end and s[all_positions[ix - 1]] in '([':
+        return True
+    for kind in '([':
+        positions = positions_by_kind[kind]
+        back_walks, forward_walks = walks[kind]
+        g = gaps[kind]
+        back = back_walks[g]
+        forward = forward_walks[g]
+        if back is None or forward is None:
+            continue
+        back_units = pos - positions[g - 1] - 1 + back[1]
+        end = positions[g] if g < len(positions) else len(s)
+        forward_units = end - pos - 1 + forward[1]
+        if back_units + forward_units < __reach:
+            return True
+        if not back[2] and (not forward[2] or forward[0] is None):
+            # The group `pos` is in may itself be inside another one
+            outer = back_walks[back[0]]
+            if outer is None:
+                continue
+            if forward[0] is None:
+                # Where that group ends (if it does) is yet to come
+                return True
+            outer_units = (positions[back[0]] - positions[back[0] - 1] - 1
+                           + outer[1])
+            if outer_units - 1 < __reach:
+                return True
+    return False
+
+
+def safe_cuts(s, chunk_size, open_end=False):
+    """Yield the positions of newlines in `s`, about `chunk_size`
+    characters apart, at which `s` can be cut so that refining the parts
+    separately gives the same result as refining it whole. With
+    `open_end`, `s` is only the beginning of the text, and the cuts are
+    safe whatever follows it."""
+    positions_by_kind = {None: [], '(': [], '[': []}
+    for match in __brackets.finditer(s):
+        positions_by_kind[None].append(match.start())
+        positions_by_kind['(' if match.group() in '()' else '['].append(
+            match.start())
+    walks = {
+        kind: __bracket_walks(s, positions_by_kind[kind], open_end)
+        for kind in '(['
+    }
+    # The index of the first bracket after the cut, moved along with it
+    gaps = dict.fromkeys(positions_by_kind, 0)
+    cut = s.find('\n', chunk_size)
+    while cut != -1:
+        for kind, positions in positions_by_kind.items():
+            g = gaps[kind]
+            while g < len(positions) and positions[g] < cut:
+                g += 1
+            gaps[kind] = g
+        if (__is_safe_cut(s, cut) and not __in_brackets(
+                s, cut, positions_by_kind, walks, gaps, open_end)):
+            yield cut
+            cut = s.find('\n', cut + 1 + chunk_size)
+        else:
+            cut = s.find('\n', cut + 1)
+
+
+def __chunks(s, chunk_size):
+    # Cut `s` at the first safe newline after every `chunk_size` characters
+    start = 0
+    for cut in safe_cuts(s, chunk_size):
+        yield s[start:cut]
+        start = cut + 1
+    yield s[start:]
+
+
+def refine_split(s, chunk_size=None):
     """Given a string with sentence splits as newlines, attempts to
     heuristically improve the splitting.
 
     Heuristics tuned for geniass sentence splitting errors.
+
+    With `chunk_size`, longer strings are refined in chunks of about that
+    many characters, cut at newlines no heuristic can reach, so that the
+    result is the same as refining the whole string (with less copying
+    and backtracking).
     """
+    if chunk_size is not None and len(s) > chunk_size:
+        return '\n'.join(
+            __refine_split(chunk) for chunk in __chunks(s, chunk_size))
+    return __refine_split(s)
+
 
+def __refine_split(s):
     if DEBUG_SS_POSTPROCESSING:
         orig = s
 
@@ -1,17 +1,121 @@
+from bisect import bisect_left
+
+from .normalizers import CollapseWhitespace, fullwidth_to_halfwidth, nfkc
+
+
+# How far past the end of the last found token to look for the next one
+DEFAULT_WINDOW = 1000
+# If a token is not in the window, the window is made this many times
+# larger, up to this many times, before the token is given up on
+WINDOW_GROWTH = 4
+MAX_WIDENINGS = 2
+
+# Tokens not found as they are are looked for again with both them and the
+# text normalised by this
+FALLBACK_NORMALIZER = (
+    fullwidth_to_halfwidth | nfkc | CollapseWhitespace(newlines=False))
+
+
 class Standoffizer:
-    def __init__(self, text, subs, start=0, skip=False):
+    """Finds the offsets of consecutive tokens `subs` in `text`.
+
+    Without `skip`, every token has to be there (or `ValueError` is
+    raised). With `skip`, tokens that are not found yield `None`, and the
+    search goes on from the end of the last token found. The next token
+    is only looked for in the `window` characters after that (plus the
+    length of the tokens missed since, to allow for drift); if it is not
+    there, the window is widened `WINDOW_GROWTH` times, up to
+    `MAX_WIDENINGS` times, so that a missing token costs bounded work, and
+    does not throw the search far ahead. `window=None` looks everywhere.
+    If `normalizer` is given (e.g. `FALLBACK_NORMALIZER`), a token missed
+    is looked for once more in the same stretch of text, with both
+    normalised (the text is only normalised once).
+
+    After iterating, `stats` holds the number of tokens found `exact`,
+    found `normalized`, and `missed`, and the number of characters
+    `skipped` between found tokens; `unplaced` lists the `(index, token)`
+    of the tokens missed.
+    """
+
+    def __init__(self, text, subs, start=0, skip=False, window=DEFAULT_WINDOW,
+                 normalizer=None):
         self.text = text
         self.subs = subs
         self.start = start
         self.skip = skip
+        self.window = window
+        self.normalizer = normalizer
+        self.stats = dict.fromkeys(
+            ('exact', 'normalized', 'missed', 'skipped'), 0)
+        self.unplaced = []
+        self._normalized = None
 
     def __iter__(self):
         offset = 0
-        finder = self.text.find if self.skip else self.text.index
-        for sub in self.subs:
-            pos = finder(sub, offset)
-            if pos != -1:
+        if not self.skip:
+            for sub in self.subs:
+                pos = self.text.index(sub, offset)
+                self.stats['exact'] += 1
+                self.stats['skipped'] += pos - offset
                 offset = pos + len(sub)
                 yield (self.start + pos, self.start + offset)
-            else:
+            return
+
+        drift = 0
+        for index, sub in enumerate(self.subs):
+            found = self._find(sub, offset, drift)
+            if found is None:
+                self.stats['missed'] += 1
+                self.unplaced.append((index, sub))
+                drift += len(sub)
                 yield None
+                continue
+            pos, end = found
+            self.stats['skipped'] += pos - offset
+            offset = end
+            drift = 0
+            yield (self.start + pos, self.start + offset)
+
+    def _find(self, sub, offset, drift):
+        text_len = len(self.text)
+        window = self.window
+        norm_sub = None
+        for _ in range(MAX_WIDENINGS + 1):
+            if window is None:
+                limit = text_len
+            else:
+                limit = min(text_len, offset + window + drift + len(sub))
+            pos = self.text.find(sub, offset, limit)
+            if pos != -1:
+                self.stats['exact'] += 1
+                return pos, pos + len(sub)
+            if self.normalizer is not None:
+                if norm_sub is None:
+                    norm_sub = self.normalizer(sub)
+                found = self._find_normalized(norm_sub, offset, limit)
+                if found is not None:
+                    self.stats['normalized'] += 1
+                    return found
+            if limit == text_len:
+                break
+            window *= WINDOW_GROWTH
+        return None
+
+    def _find_normalized(self, norm_sub, offset, limit):
+        if not norm_sub:
+            return None
+        if self._normalized is None:
+            self._normalized = self.normalizer.map(self.text)
+        norm_text, offset_map = self._normalized
+        norm_pos = norm_text.find(
+            norm_sub, offset_map.starts[offset], offset_map.ends[limit])
+        if norm_pos == -1:
+            return None
+        # The first offsets (from `offset` on) that map to the ends of the
+        # match
+        start = bisect_left(offset_map.starts, norm_pos, offset, limit)
+        end = bisect_left(
+            offset_map.ends, norm_pos + len(norm_sub), start, limit)
+        if start >= end:
+            return None
+        return start, end
@@ -1,11 +1,103 @@
+from threading import local, Lock
+
 from sudachipy import dictionary, tokenizer
-from .standoffizer import Standoffizer
+from .offsets import Offsets
 from .simplesplit import find_sentence_standoffs
 
-sudachi_tokenizer = dictionary.Dictionary().create()
+# Sudachi refuses longer input (in UTF-8 bytes)
+MAX_INPUT_BYTES = 49149
+# Texts are tokenized in chunks of whole sentences at most this long (in
+# UTF-8 bytes); it should not be more than `MAX_INPUT_BYTES`
+DEFAULT_CHUNK_BYTES = 16384
+
+# Split modes are sent to worker processes by index
+_SPLIT_MODES = (
+    tokenizer.Tokenizer.SplitMode.A,
+    tokenizer.Tokenizer.SplitMode.B,
+    tokenizer.Tokenizer.SplitMode.C,
+)
+
+# The dictionary takes a while to load, so it is only loaded on first use,
+# and shared; tokenizers are not thread-safe, so each thread creates its own
+_dictionary = None
+_dictionary_lock = Lock()
+_local = local()
+
+def get_tokenizer():
+    """Return the calling thread's Sudachi tokenizer."""
+    global _dictionary
+    sudachi_tokenizer = getattr(_local, 'tokenizer', None)
+    if sudachi_tokenizer is None:
+        with _dictionary_lock:
+            if _dictionary is None:
+                _dictionary = dictionary.Dictionary()
+        sudachi_tokenizer = _local.tokenizer = _dictionary.create()
+    return sudachi_tokenizer
+
+def warmup():
+    """Load the dictionary now rather than on the first tokenisation (and
+    create the calling thread's tokenizer)."""
+    get_tokenizer()
+
+def __getattr__(name):
+    # `sudachi_tokenizer` used to be created on import
+    if name == 'sudachi_tokenizer':
+        return get_tokenizer()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def _chunks(text, chunk_bytes):
+    # Cut `text` between sentences into chunks of at most `chunk_bytes`
+    # bytes; sentences longer than that are cut anywhere
+    if len(text.encode('utf-8')) <= chunk_bytes:
+        return [(0, len(text))]
+    cuts = [start for start, _ in find_sentence_standoffs(text)[1:]]
+    cuts.append(len(text))
+    chunks = []
+    chunk_start = chunk_end = 0
+    size = 0
+    for cut in cuts:
+        piece_size = len(text[chunk_end:cut].encode('utf-8'))
+        if size + piece_size > chunk_bytes and chunk_end > chunk_start:
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end
+            size = 0
+        if piece_size > chunk_bytes:
+            # No character takes more than four bytes
+            for start in range(chunk_end, cut, chunk_bytes // 4):
+                chunks.append((start, min(cut, start + chunk_bytes // 4)))
+            chunk_start = cut
+            piece_size = 0
+        size += piece_size
+        chunk_end = cut
+    if chunk_end > chunk_start:
+        chunks.append((chunk_start, chunk_end))
+    return chunks
+
+def _tokenize_chunk(args):
+    chunk, offset, mode_index, whitespace = args
+    return [
+        (offset + m.begin(), offset + m.end())
+        for m in get_tokenizer().tokenize(chunk, _SPLIT_MODES[mode_index])
+        if whitespace or not m.surface().isspace()
+    ]
 
-def find_token_standoffs(text, mode=tokenizer.Tokenizer.SplitMode.A, whitespace=False):
-    tokens = [m.surface() for m in sudachi_tokenizer.tokenize(text, mode)]
-    if not whitespace:
-        tokens = [t for t in tokens if not t.isspace()]
-    return list(Standoffizer(text, tokens))
+def find_token_standoffs(text, mode=tokenizer.Tokenizer.SplitMode.A, whitespace=False,
+                         chunk_bytes=DEFAULT_CHUNK_BYTES, pool=None,
+                         compact=False):
+    """Tokenize `text`, in chunks of whole sentences of at most
+    `chunk_bytes` UTF-8 bytes. The chunks are tokenized in turn, or by
+    `pool`, which can be anything with a `map` method (such as
+    `multiprocessing.Pool` or `concurrent.futures.ProcessPoolExecutor`).
+    With `compact`, the standoffs of each chunk go straight into an
+    `Offsets`."""
+    mode_index = _SPLIT_MODES.index(mode)
+    jobs = [(text[start:end], start, mode_index, whitespace)
+            for start, end in _chunks(text, chunk_bytes)]
+    if pool is None:
+        results = map(_tokenize_chunk, jobs)
+    else:
+        results = pool.map(_tokenize_chunk, jobs)
+    standoffs = (standoff for result in results for standoff in result)
+    if compact:
+        return Offsets.from_pairs(standoffs)
+    return list(standoffs)
@@ -4,7 +4,8 @@ from collections import defaultdict
 import bisect
 import itertools
 from .annotation import TextAnnotations, TextBoundAnnotationWithText, EventAnnotation, BinaryRelationAnnotation
-from .standoffizer import Standoffizer
+from .standoffizer import Standoffizer, DEFAULT_WINDOW, FALLBACK_NORMALIZER
+from .splitters import get_splitter, DEFAULT_SPLITTER
 
 # _header_re = re.compile(r"^#(?P<name>FORMAT|Sentence.id|T_(?:SP|RL|CH)|Text)=(?P<content>.*)$")
 _header_re = re.compile(r"^#(?:(?P<name>FORMAT|Sentence.id|T_(?:SP|RL|CH)|Text|VALS)=(?P<content>.*)$)?")
@@ -438,10 +439,26 @@ def make_textspans(dis_ids, dis_id_by_anno_id, evts, rels, chains, doc):
 
 
 
-def from_lines(lines, text=None, modifier=None):
+def from_lines(lines, text=None, modifier=None, window=DEFAULT_WINDOW,
+               stats=None):
+    # Unless `modifier` maps the offsets itself, the (modified) tokens are
+    # looked up in `text`, each within `window` characters of the last (see
+    # `Standoffizer`); `stats`, if a dict, gets the alignment statistics,
+    # and the `unplaced` tokens, which are left out of the document
     headers, annos, tsv_text, _ = preparse(lines)
 
-    if modifier is not None or text is not None:
+    if text is None and hasattr(modifier, 'map'):
+        # The modifier tells where the tokens went
+        text, offset_map = modifier.map(tsv_text)
+        new_annos = []
+        for anno in annos:
+            start, end = offset_map.map_span(*anno[2])
+            if start < end:
+                anno[2] = (start, end)
+                anno[3] = text[start:end]
+                new_annos.append(anno)
+        annos = new_annos
+    elif modifier is not None or text is not None:
         if modifier is None:
             modifier = lambda x: x
         if text is None:
@@ -451,13 +468,17 @@ def from_lines(lines, text=None, modifier=None):
         for anno in annos:
             anno[3] = modifier(anno[3])
             tokens.append(anno[3])
-        standoffizer = Standoffizer(text, tokens, skip=True)
+        standoffizer = Standoffizer(text, tokens, skip=True, window=window,
+                                    normalizer=FALLBACK_NORMALIZER)
         new_annos = []
         for anno, token, standoff in zip(annos, tokens, standoffizer):
             if standoff:
                 anno[2] = standoff
                 new_annos.append(anno)
         annos = new_annos
+        if stats is not None:
+            stats.update(standoffizer.stats)
+            stats['unplaced'] = standoffizer.unplaced
     else:
         text = tsv_text
 
@@ -481,9 +502,18 @@ def is_full_tsv(lines):
     return has_annos
 
 
-def to_lines(doc, headers, sentence_offsets, token_offsets, vals):
+def to_lines(doc, headers, sentence_offsets, token_offsets, vals,
+             splitter=DEFAULT_SPLITTER):
     header_lines = [str(header) for header in headers]
     text = doc.get_document_text()
+    # The offsets not given (None) are found by `splitter` (see `splitters`);
+    # offsets can be lists of pairs or `Offsets`
+    if sentence_offsets is None:
+        sentence_offsets = get_splitter(splitter).find_sentence_standoffs(
+            text, compact=True)
+    if token_offsets is None:
+        token_offsets = get_splitter(splitter).find_token_standoffs(
+            text, compact=True)
     sentence_texts = [text[start:end] for start, end in sentence_offsets]
     num_cols = sum(len(header.slots) for header in headers)
 
@@ -525,7 +555,10 @@ def to_lines(doc, headers, sentence_offsets, token_offsets, vals):
     dis_id = 1
     dis_ids_map = {}
     entity_map = {}
-    token_starts = [start for start, end in token_offsets]
+    # `Offsets` have them already
+    token_starts = getattr(token_offsets, 'starts', None)
+    if token_starts is None:
+        token_starts = [start for start, end in token_offsets]
     for ann in doc.get_textbounds():
         val = ann.type
         header, slot = (
@@ -620,7 +653,7 @@ if __name__ == "__main__":
     import sys
 
     if len(sys.argv) == 1:
-        print("python -m bratpy.webanno_tsv webanno_header.tsv brat_doc \tconvert brat to WebAnno tsv")
+        print("python -m bratpy.webanno_tsv webanno_header.tsv brat_doc [splitter]\tconvert brat to WebAnno tsv (default splitter: sudachi)")
         print("python -m bratpy.webanno_tsv webanno_doc.tsv [text.txt]  \tconvert WebAnno tsv to brat")
         sys.exit(1)
 
@@ -640,7 +673,11 @@ if __name__ == "__main__":
                 with open(sys.argv[2], "rt") as r:
                     text = r.read()
 
-        doc = from_lines(lines, text)
+        stats = {}
+        doc = from_lines(lines, text, stats=stats)
+        for index, token in stats.get('unplaced', ()):
+            print("Token %d not found in the text: %r" % (index, token),
+                  file=sys.stderr)
         if output_text:
             print(doc.get_document_text())
         else:
@@ -648,9 +685,6 @@ if __name__ == "__main__":
     else:
         headers, vals = headers_from_lines(lines)
         doc = TextAnnotations(sys.argv[2])
-        from .sudachisplit import find_sentence_standoffs, find_token_standoffs
-        text = doc.get_document_text()
-        sentence_offsets = list(find_sentence_standoffs(text))
-        token_offsets = list(find_token_standoffs(text))
-        tsv = to_lines(doc, headers, sentence_offsets, token_offsets, vals)
+        splitter = sys.argv[3] if len(sys.argv) >= 4 else "sudachi"
+        tsv = to_lines(doc, headers, None, None, vals, splitter=splitter)
         print("".join(tsv), end="")
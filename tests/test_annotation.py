@@ -0,0 +1,133 @@
+import os
+
+import pytest
+
+from bratpy import annotation
+from bratpy.annotation import (
+    DuplicateAnnotationIdError, EquivAnnotation, MessageCollector,
+    TextAnnotations, TextBoundAnnotationWithText)
+
+
+TEXT = 'a big dog and a small cat'
+
+
+def _textbound(start, end, id, type):
+    return TextBoundAnnotationWithText([(start, end)], id, type, TEXT[start:end])
+
+
+def _doc():
+    doc = TextAnnotations(text=TEXT)
+    doc.add_annotation(_textbound(2, 5, 'T1', 'Size'))
+    return doc
+
+
+def test_add_rejects_duplicate_id():
+    doc = _doc()
+    version = doc.version
+    with pytest.raises(DuplicateAnnotationIdError):
+        doc.add_annotation(_textbound(6, 9, 'T1', 'Animal'))
+    assert [str(ann) for ann in doc] == ['T1\tSize 2 5\tbig']
+    assert doc.get_ann_by_id('T1').spans == [(2, 5)]
+    assert doc.version == version
+
+
+def test_read_overwrites_duplicate_id():
+    # Loading checks for duplicates itself, and still overwrites as all
+    # adds did before
+    doc = _doc()
+    doc.add_annotation(_textbound(6, 9, 'T1', 'Animal'), read=True)
+    assert len(doc) == 2
+    assert doc.get_ann_by_id('T1').type == 'Animal'
+
+
+def test_batch_defers_mtime():
+    doc = _doc()
+    doc.add_annotation(EquivAnnotation('Equiv', ['T1', 'T2'], ''))
+    doc.ann_mtime = 0
+    with doc.batch():
+        # Without an id, then with one
+        doc.del_annotation(next(doc.get_equivs()))
+        doc.del_annotation(doc.get_ann_by_id('T1'))
+        assert doc.ann_mtime == 0
+    assert doc.ann_mtime > 0
+
+
+def test_batch_rejects_duplicate_id():
+    doc = _doc()
+    with pytest.raises(DuplicateAnnotationIdError):
+        with doc.batch():
+            doc.add_annotation(_textbound(6, 9, 'T2', 'Animal'))
+            doc.add_annotation(_textbound(22, 25, 'T1', 'Animal'))
+    assert [str(ann) for ann in doc] == ['T1\tSize 2 5\tbig']
+
+
+def test_batch_rollback_undoes_each_change():
+    doc = _doc()
+    doc.add_annotation(_textbound(6, 9, 'T2', 'Animal'))
+    before = [str(ann) for ann in doc]
+    with pytest.raises(DuplicateAnnotationIdError):
+        with doc.batch():
+            doc.modify_annotation(doc.get_ann_by_id('T1'), type='Height')
+            doc.del_annotation(doc.get_ann_by_id('T2'))
+            doc.add_annotation(_textbound(22, 25, 'T3', 'Animal'))
+            doc.add_annotation(_textbound(16, 21, 'T3', 'Size'))
+    assert [str(ann) for ann in doc] == before
+    assert sorted(doc._ann_by_id) == ['T1', 'T2']
+    assert doc._line_by_ann == {ann: i for i, ann in enumerate(doc)}
+    doc.add_annotation(_textbound(22, 25, 'T3', 'Animal'))
+    assert doc.get_ann_by_id('T3').type == 'Animal'
+
+
+def test_copy_on_write_per_container():
+    doc = _doc()
+    lines, ann_by_id = doc._lines, doc._ann_by_id
+    # Batches do not share the containers
+    with doc.batch():
+        doc.add_annotation(_textbound(6, 9, 'T2', 'Animal'))
+    assert doc._lines is lines and doc._ann_by_id is ann_by_id
+    snapshot = doc.snapshot()
+    # Equivs have no id, so only the lines are copied
+    doc.add_annotation(EquivAnnotation('Equiv', ['T1', 'T2'], ''))
+    assert doc._lines is not lines and doc._ann_by_id is ann_by_id
+    assert len(snapshot) == 2 and len(doc) == 3
+    doc.add_annotation(_textbound(22, 25, 'T3', 'Animal'))
+    assert doc._ann_by_id is not ann_by_id
+    assert snapshot.get_ann_by_id('T2').type == 'Animal'
+    assert 'T3' not in snapshot._ann_by_id
+
+
+def test_ann_file_suffixes_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(annotation, 'ANN_FILE_SUFFIXES_CACHE_SIZE', 2)
+    monkeypatch.setattr(annotation, '_ann_file_suffixes_cache',
+                        type(annotation._ann_file_suffixes_cache)())
+    dirs = []
+    for name in 'abc':
+        path = tmp_path / name
+        path.mkdir()
+        (path / 'doc.ann').write_text('')
+        dirs.append(str(path))
+        assert annotation._ann_file_suffixes(str(path)) == {'doc': {'ann'}}
+    assert list(annotation._ann_file_suffixes_cache) == dirs[1:]
+
+    # A directory replaced by another one is listed again, even with the
+    # same modification time
+    mtime = os.stat(dirs[2]).st_mtime_ns
+    os.rename(dirs[2], str(tmp_path / 'd'))
+    (tmp_path / 'c').mkdir()
+    (tmp_path / 'c' / 'doc.a1').write_text('')
+    os.utime(dirs[2], ns=(mtime, mtime))
+    assert annotation._ann_file_suffixes(dirs[2]) == {'doc': {'a1'}}
+
+
+def test_messages_are_strings():
+    collector = MessageCollector(max_errors=2)
+    collector.error('Undefined %s in %s', args=('T1', 'E1'),
+                    code='undefined', line_num=3, ann_id='E1')
+    collector.error('Second')
+    collector.error('Dropped %s', args=('T2',))
+    errors = collector.messages.errors
+    assert '\n'.join(errors) == 'Undefined T1 in E1\nSecond'
+    assert errors[0] == 'Undefined T1 in E1'
+    assert (errors[0].code, errors[0].line_num, errors[0].ann_id) == (
+        'undefined', 3, 'E1')
+    assert collector.messages.dropped_errors == 1
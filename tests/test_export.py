@@ -0,0 +1,33 @@
+from json import loads
+
+from bratpy import json as brat_json
+from bratpy.annotation import TextAnnotations
+from bratpy.export import get_doc_json_line
+
+
+def _document(tmp_path):
+    (tmp_path / 'doc.txt').write_text('A big dog. A small cat.\n')
+    (tmp_path / 'doc.ann').write_text('T1\tSize 2 5\tbig\n')
+    return str(tmp_path / 'doc')
+
+
+def test_line_has_all_keys(tmp_path):
+    document = _document(tmp_path)
+    doc_data = loads(get_doc_json_line(document))
+    assert doc_data['document'] == document
+    assert doc_data['annfile'] == 'T1\tSize 2 5\tbig\n'
+    assert doc_data['entities'] == [['T1', 'Size', [[2, 5]]]]
+    assert doc_data['token_offsets'][:2] == [[0, 1], [2, 5]]
+
+
+def test_omitted_keys_are_not_built(tmp_path, monkeypatch):
+    def fail(*args):
+        raise AssertionError('not omitted')
+    monkeypatch.setattr(TextAnnotations, '__str__', fail)
+    monkeypatch.setattr(brat_json, '_get_standoffs', fail)
+    doc_data = loads(get_doc_json_line(
+        _document(tmp_path),
+        omit=('annfile', 'text', 'token_offsets', 'sentence_offsets')))
+    assert not {'annfile', 'text', 'token_offsets',
+                'sentence_offsets'} & set(doc_data)
+    assert doc_data['entities'] == [['T1', 'Size', [[2, 5]]]]
@@ -0,0 +1,101 @@
+import random
+import re
+
+import pytest
+
+from bratpy.alignment import AlignmentError, align
+from bratpy.annotation import TextAnnotations, TextBoundAnnotationWithText
+from bratpy.modify_annotations import modify_annotations
+from bratpy.normalizers import CollapseWhitespace, RegexNormalizer
+
+
+def _doc(text, spans):
+    doc = TextAnnotations(text=text)
+    for num, (start, end) in enumerate(spans, 1):
+        doc.add_annotation(TextBoundAnnotationWithText(
+            [(start, end)], 'T%d' % num, 'Name', text[start:end]))
+    return doc
+
+
+def _textbounds(doc):
+    return [(ann.id, ann.spans, ann.text) for ann in doc.get_textbounds()]
+
+
+def test_align_keeps_case_changes_in_place():
+    offset_map = align('Bob Bob Bob', 'bob bob bob')
+    assert [offset_map.map_span(start, start + 3) for start in (0, 4, 8)] == [
+        (0, 3), (4, 7), (8, 11)]
+
+
+def test_lower_keeps_repeated_tokens_in_place():
+    doc = _doc('Bob Bob Bob', [(0, 3), (4, 7), (8, 11)])
+    modify_annotations(doc, str.lower)
+    assert doc.get_document_text() == 'bob bob bob'
+    assert _textbounds(doc) == [
+        ('T1', [(0, 3)], 'bob'), ('T2', [(4, 7)], 'bob'),
+        ('T3', [(8, 11)], 'bob')]
+
+
+def test_collapse_whitespace_with_repeated_tokens():
+    text = 'Bob  Bob\n\n Bob \t Bob'
+    spans = [(match.start(), match.end())
+             for match in re.finditer('Bob', text)]
+    expected = [
+        ('T%d' % num, [(start, start + 3)], 'Bob')
+        for num, start in enumerate((0, 4, 8, 12), 1)]
+
+    # Aligned after the fact, and mapped by the normaliser
+    def collapse(text):
+        return re.sub(r'\s+', ' ', text)
+    for modifier in (collapse, CollapseWhitespace(newlines=False)):
+        doc = _doc(text, spans)
+        modify_annotations(doc, modifier)
+        assert doc.get_document_text() == 'Bob Bob Bob Bob'
+        assert _textbounds(doc) == expected
+
+
+def test_undo_restores_text_and_spans():
+    text = 'Bob  Bob  Bob'
+    doc = _doc(text, [(5, 8)])
+    modify_annotations(doc, lambda text: ' '.join(text.lower().split()))
+    assert doc.get_document_text() == 'bob bob bob'
+    assert _textbounds(doc) == [('T1', [(4, 7)], 'bob')]
+    assert doc.undo()
+    assert doc.get_document_text() == text
+    assert _textbounds(doc) == [('T1', [(5, 8)], 'Bob')]
+    assert doc.redo()
+    assert doc.get_document_text() == 'bob bob bob'
+    assert _textbounds(doc) == [('T1', [(4, 7)], 'bob')]
+
+
+@pytest.mark.parametrize('lines, words', [(1, 5000), (4000, 8)])
+def test_align_long_documents(lines, words):
+    rng = random.Random(lines)
+    vocabulary = ['w%d' % n for n in range(300)] + ['the', 'Bob', 'colour']
+    text = ''.join(
+        ' '.join(rng.choice(vocabulary) for _ in range(words)) + '.\n'
+        for _ in range(lines))
+    # The normaliser knows where everything went
+    new_text, expected = RegexNormalizer(
+        r'\bthe |colour|\bBob\b',
+        lambda match: {'the ': '', 'colour': 'color'}.get(
+            match.group(), 'Robert')).map(text)
+    for new_text in (new_text, new_text.upper()):
+        offset_map = align(text, new_text)
+        for match in re.finditer(r'\w+', text):
+            assert offset_map.map_span(*match.span()) == expected.map_span(
+                *match.span())
+
+
+def test_align_too_different():
+    with pytest.raises(AlignmentError):
+        align('ab' * 30000, 'ba' * 30000 + 'c')
+
+
+def test_unmoved_annotations_are_left_alone():
+    doc = _doc('Bob  and Bob', [(0, 3), (9, 12)])
+    first = doc.get_ann_by_id('T1')
+    modify_annotations(doc, CollapseWhitespace())
+    assert doc.get_ann_by_id('T1') is first
+    assert _textbounds(doc) == [
+        ('T1', [(0, 3)], 'Bob'), ('T2', [(8, 11)], 'Bob')]
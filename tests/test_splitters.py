@@ -0,0 +1,60 @@
+from bratpy.annotation import (
+    Stats, disable_stats, enable_stats, get_global_stats, reset_global_stats)
+from bratpy.offsets import Offsets
+from bratpy.splitters import StandoffCache, get_splitter
+
+
+def _split(cache, text, stats=None):
+    return cache.get(text, splitter='simple', stats=stats)
+
+
+def test_cache_hits_counted_in_current_global_stats():
+    cache = StandoffCache()
+    reset_global_stats()
+    enable_stats()
+    try:
+        _split(cache, 'One.\nTwo.\n')
+        _split(cache, 'One.\nTwo.\n')
+        assert get_global_stats()['counters']['cache_hits'] == 1
+        stats = Stats()
+        _split(cache, 'One.\nTwo.\n', stats)
+        assert stats.counters['cache_hits'] == 1
+        assert get_global_stats()['counters']['cache_hits'] == 2
+        reset_global_stats()
+        _split(cache, 'One.\nTwo.\n')
+        assert get_global_stats()['counters']['cache_hits'] == 1
+    finally:
+        disable_stats()
+    # Only counted when enabled
+    _split(cache, 'One.\nTwo.\n')
+    assert get_global_stats()['counters']['cache_hits'] == 1
+
+
+def test_cache_bounded_by_size():
+    # Two sentences and three tokens take 80 bytes
+    cache = StandoffCache(max_bytes=160)
+    texts = ['One %d.\nTwo.\n' % n for n in range(3)]
+    for text in texts:
+        _split(cache, text)
+    assert len(cache._entries) == 2 and cache._bytes == 160
+    stats = Stats()
+    _split(cache, texts[0], stats)
+    assert stats.counters['cache_hits'] == 0
+    _split(cache, texts[2], stats)
+    assert stats.counters['cache_hits'] == 1
+    # Too large to be kept at all
+    _split(cache, 'word ' * 20 + 'end.\n')
+    assert len(cache._entries) == 2
+
+
+def test_compact_split_matches_pairs():
+    text = 'One sentence here.  Another one.\nLast'
+    splitter = get_splitter('simple')
+    sentences, tokens = splitter.split(text, compact=True)
+    assert isinstance(sentences, Offsets) and isinstance(tokens, Offsets)
+    assert (sentences.tolist(), tokens.tolist()) == splitter.split(text)
+
+
+def test_offsets_from_generator():
+    offsets = Offsets.from_pairs((n, n + 1) for n in range(3))
+    assert offsets.tolist() == [(0, 1), (1, 2), (2, 3)]
@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from bratpy.ssplit import (
+    SENTENCE_END_REGEX, regex_sentence_boundary_gen,
+    stream_sentence_boundary_gen)
+from bratpy.sspostproc import refine_split
+
+
+WORDS = ['cells', 'Gene', 'was', 'e.g.', 'Fig.', 'Dr.', 'i.e.', 'vs.', 'p53',
+         'A.', 'no.', '3', 'and', ',', '.', '?', '!']
+BRACKETED = ['(see', 'text)', '[1]', '(', ')', '[', ']']
+SEPARATORS = [' ', ' ', ' ', ' ', '\n', '. ', '.\n', ' (', ') ', '\n\n']
+
+
+def _random_text(rng, num_words):
+    # Brackets are either common, or rare enough to leave groups open over
+    # long stretches of text
+    bracket_rate = rng.choice([0.3, 0.02])
+    words = []
+    for _ in range(num_words):
+        if rng.random() < bracket_rate:
+            words.append(rng.choice(BRACKETED))
+        else:
+            words.append(rng.choice(WORDS))
+        words.append(rng.choice(SEPARATORS[:4] if bracket_rate < 0.1
+                                else SEPARATORS))
+    return ''.join(words)
+
+
+@pytest.mark.parametrize('chunk_size', [7, 23, 40, 64, 150])
+def test_stream_matches_whole_text(chunk_size):
+    rng = random.Random(chunk_size)
+    for _ in range(100):
+        text = _random_text(rng, rng.randrange(1, 400))
+        assert list(stream_sentence_boundary_gen(text, chunk_size)) == list(
+            regex_sentence_boundary_gen(text)), text
+
+
+def test_stream_unclosed_bracket():
+    text = 'Intro (open. ' + ''.join(
+        'Sentence %d cites [1].\nNext one.\n' % n for n in range(60)
+    ) + ' done) end.\n'
+    assert list(stream_sentence_boundary_gen(text, 40)) == list(
+        regex_sentence_boundary_gen(text))
+
+
+def _reference_refine_split(offsets, original_text):
+    # `ssplit._refine_split` as it was, injecting each original newline by
+    # a search through all the offsets
+    new_text = '\n'.join((original_text[o[0]:o[1]].replace('\n', ' ')
+                          for o in offsets))
+
+    output = refine_split(new_text)
+
+    old_offsets = offsets[::-1]
+    if len(old_offsets) == 0:
+        old_offsets.append((0, len(original_text), ))
+    new_offsets = []
+    for refined_sentence in output.split('\n'):
+        new_offset = old_offsets.pop()
+        while new_offset[1] - new_offset[0] < len(refined_sentence) - 1:
+            _, next_end = old_offsets.pop()
+            new_offset = (new_offset[0], next_end)
+        new_offsets.append(new_offset)
+
+    if len(new_offsets) != 0 and new_offsets[-1][1] != len(original_text) - 1:
+        start = new_offsets[-1][1] + 1
+        while start < len(original_text) and original_text[start].isspace():
+            start += 1
+        if start < len(original_text) - 1:
+            new_offsets.append((start, len(original_text) - 1))
+
+    last_newline = -1
+    while True:
+        try:
+            orig_newline = original_text.index('\n', last_newline + 1)
+        except ValueError:
+            break
+
+        for o_start, o_end in new_offsets:
+            if o_start <= orig_newline < o_end:
+                new_offsets.remove((o_start, o_end))
+                new_offsets.extend(((o_start, orig_newline, ),
+                                    (orig_newline + 1, o_end), ))
+                break
+            elif o_end == orig_newline:
+                break
+        else:
+            new_offsets.append((orig_newline, orig_newline, ))
+
+        last_newline = orig_newline
+
+    new_offsets.sort()
+    return new_offsets
+
+
+def test_newline_merge_matches_reference():
+    rng = random.Random(0)
+    whitespace = [' ', '  ', '\n', '\n\n', ' \n ', '\n\n\n', '\t', '.\n']
+    for _ in range(500):
+        text = ''.join(
+            rng.choice(WORDS) + rng.choice(whitespace)
+            for _ in range(rng.randrange(0, 60)))
+        if rng.random() < 0.3:
+            text = rng.choice(whitespace) + text
+        if rng.random() < 0.5:
+            text = text.rstrip()
+        offsets = [match.span() for match in SENTENCE_END_REGEX.finditer(text)]
+        assert list(regex_sentence_boundary_gen(text)) == (
+            _reference_refine_split(offsets, text)), text
@@ -0,0 +1,38 @@
+from bratpy.standoffizer import FALLBACK_NORMALIZER, Standoffizer
+
+
+def test_resyncs_after_long_gap():
+    text = 'alpha beta ' + '#' * 1500 + ' gamma delta epsilon zeta'
+    tokens = text.replace('#', ' ').split()
+    standoffizer = Standoffizer(text, tokens, skip=True)
+    standoffs = list(standoffizer)
+    assert [text[start:end] for start, end in standoffs] == tokens
+    assert standoffizer.unplaced == []
+
+
+def test_prefers_nearby_normalized_match():
+    text = 'ｆｏｏ bar ' + ' ' * 50 + 'foo'
+    standoffizer = Standoffizer(text, ['foo', 'bar'], skip=True, window=10,
+                                normalizer=FALLBACK_NORMALIZER)
+    assert list(standoffizer) == [(0, 3), (4, 7)]
+    assert standoffizer.stats['normalized'] == 1
+
+
+def test_reports_unplaced_tokens():
+    text = 'one two  three'
+    standoffizer = Standoffizer(
+        text, ['one', 'missing', 'two three', 'four'], skip=True, window=2,
+        normalizer=FALLBACK_NORMALIZER)
+    assert list(standoffizer) == [(0, 3), None, (4, 14), None]
+    assert standoffizer.unplaced == [(1, 'missing'), (3, 'four')]
+    assert standoffizer.stats == {
+        'exact': 1, 'normalized': 1, 'missed': 2, 'skipped': 1}
+
+
+def test_far_token_is_unplaced():
+    text = 'alpha gamma ' + '#' * 20000 + ' beta'
+    standoffizer = Standoffizer(text, ['beta', 'alpha', 'gamma'], skip=True,
+                                window=100)
+    # `beta` is too far to be looked for, and the search stays at the start
+    assert list(standoffizer) == [None, (0, 5), (6, 11)]
+    assert standoffizer.unplaced == [(0, 'beta')]
@@ -0,0 +1,101 @@
+from random import Random
+from threading import Thread
+
+from bratpy.annotation import (
+    AnnotationNotFoundError, IdedAnnotation, TextAnnotations,
+    TextBoundAnnotationWithText, annotation_id_number, annotation_id_prefix)
+
+
+TEXT = "To boldly go where no one has gone before. " * 20
+
+
+def _check_invariants(doc):
+    # The internal indices of `doc` are in sync with its lines
+    with doc._lock.read:
+        lines = doc._lines
+        assert len(doc._line_by_ann) == len(lines)
+        ided = {}
+        for line_num, ann in enumerate(lines):
+            assert doc._line_by_ann[ann] == line_num
+            if isinstance(ann, IdedAnnotation):
+                ided[ann.id] = ann
+        assert ided == doc._ann_by_id
+        for id in ided:
+            prefix = annotation_id_prefix(id)
+            assert doc._max_id_num_by_prefix[prefix] >= int(
+                annotation_id_number(id))
+
+
+def _random_textbound(doc, rng):
+    start = rng.randrange(len(TEXT) - 10)
+    end = start + rng.randrange(1, 10)
+    return TextBoundAnnotationWithText(
+        [[start, end]], doc.get_new_id('T'), 'X', TEXT[start:end])
+
+
+def _writer(doc, seed, ops, errors):
+    rng = Random(seed)
+    try:
+        for _ in range(ops):
+            op = rng.random()
+            if op < 0.5:
+                # Generating and using an id has to be atomic
+                with doc.batch():
+                    doc.add_annotation(_random_textbound(doc, rng))
+            elif op < 0.75:
+                with doc.batch():
+                    anns = list(doc.get_textbounds())
+                    if anns:
+                        doc.del_annotation(rng.choice(anns))
+            elif op < 0.95:
+                with doc.batch():
+                    anns = list(doc.get_textbounds())
+                    if anns:
+                        doc.modify_annotation(rng.choice(anns), type='Y')
+            else:
+                doc.undo()
+    except Exception as e:
+        errors.append(e)
+
+
+def _reader(doc, seed, ops, errors):
+    rng = Random(seed)
+    try:
+        for _ in range(ops):
+            op = rng.random()
+            if op < 0.4:
+                for ann in doc:
+                    try:
+                        doc.get_ann_by_id(ann.id)
+                    except AnnotationNotFoundError:
+                        # Deleted since; fine
+                        pass
+            elif op < 0.7:
+                snapshot = doc.snapshot()
+                lines = str(snapshot).splitlines()
+                assert len(lines) == len(snapshot)
+            elif op < 0.9:
+                _check_invariants(doc)
+            else:
+                len(doc)
+                doc.get_new_id('T')
+    except Exception as e:
+        errors.append(e)
+
+
+def test_concurrent_readers_and_writers():
+    doc = TextAnnotations(text=TEXT, thread_safe=True)
+    errors = []
+    threads = [
+        Thread(target=_writer, args=(doc, seed, 300, errors))
+        for seed in range(4)
+    ] + [
+        Thread(target=_reader, args=(doc, seed, 300, errors))
+        for seed in range(4, 12)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    _check_invariants(doc)